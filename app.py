@@ -7,22 +7,28 @@ import streamlit as st
 import pandas as pd
 import os
 import sys
+import time
+import shutil
+import hashlib
+import uuid
 
 # Add parent directory to path for imports
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 from config import (
-    WHISPER_MODELS, TRANSLATION_MODELS, TTS_PROVIDERS,
+    WHISPER_MODELS, COMPUTE_TYPES, VIDEO_ENCODERS, TRANSLATION_MODELS, TTS_PROVIDERS,
     FPT_VOICES, ELEVENLABS_VOICES, OPENAI_VOICES, DEFAULTS
 )
-from core.transcriber import transcribe_video, format_timecode_range
-from core.translator import translate_segments, estimate_cost
-from core.tts import generate_all_audio, get_tts_provider
-from core.merger import export_video, create_srt_file, check_ffmpeg_installed
+# core.transcriber (faster-whisper/CTranslate2), core.translator và core.tts được
+# import lazy trong hàm dùng chúng để trang đầu tiên load nhanh
+from core.merger import export_video, create_srt_text, check_ffmpeg_installed
 from utils.file_utils import (
     save_uploaded_file, download_youtube, is_youtube_url,
-    get_video_info, cleanup_temp_files, TEMP_DIR, ensure_temp_dir
+    get_video_info, cleanup_temp_files, create_session_dir, file_fingerprint
 )
+from utils import background
+from utils.translation_cache import clear_translation_cache
+from utils.tts_cache import clear_tts_cache
 
 
 # ============================================
@@ -41,229 +47,24 @@ st.set_page_config(
 # CUSTOM CSS
 # ============================================
 
-st.markdown("""
-<style>
-    /* Import Google Fonts */
-    @import url('https://fonts.googleapis.com/css2?family=Outfit:wght@300;400;600;700&display=swap');
-    @import url('https://fonts.googleapis.com/css2?family=JetBrains+Mono:wght@400;700&display=swap');
+CSS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "styles.css")
 
-    /* Global Typography */
-    html, body, [class*="css"] {
-        font-family: 'Outfit', sans-serif;
-    }
-    
-    code {
-        font-family: 'JetBrains Mono', monospace;
-    }
-
-    /* Deep Space Theme Background */
-    .stApp {
-        background-color: #0F172A;
-        background-image: 
-            radial-gradient(at 0% 0%, hsla(253,16%,7%,1) 0, transparent 50%), 
-            radial-gradient(at 50% 0%, hsla(225,39%,30%,1) 0, transparent 50%), 
-            radial-gradient(at 100% 0%, hsla(339,49%,30%,1) 0, transparent 50%);
-        color: #E2E8F0;
-    }
-
-    /* Main Header */
-    .main-header {
-        text-align: center;
-        padding: 2rem 0 1rem 0;
-        background: linear-gradient(135deg, #A5B4FC 0%, #C084FC 100%);
-        -webkit-background-clip: text;
-        -webkit-text-fill-color: transparent;
-        font-size: 3.5rem;
-        font-weight: 700;
-        letter-spacing: -0.02em;
-        text-shadow: 0 0 30px rgba(192, 132, 252, 0.3);
-        margin-bottom: 0.5rem;
-    }
-    
-    .sub-header {
-        text-align: center;
-        color: #94A3B8;
-        font-size: 1.1rem;
-        font-weight: 300;
-        margin-bottom: 3rem;
-    }
-
-    /* Step Indicator - Wizard Style */
-    .step-indicator-container {
-        display: flex;
-        justify-content: center;
-        align-items: center;
-        margin-bottom: 3rem;
-        position: relative;
-    }
-    
-    .step-item {
-        display: flex;
-        flex-direction: column;
-        align-items: center;
-        z-index: 2;
-        width: 120px;
-    }
-    
-    .step-circle {
-        width: 40px;
-        height: 40px;
-        border-radius: 50%;
-        background: #1E293B;
-        border: 2px solid #334155;
-        display: flex;
-        justify-content: center;
-        align-items: center;
-        font-weight: 600;
-        color: #64748B;
-        transition: all 0.3s ease;
-        margin-bottom: 0.5rem;
-    }
-    
-    .step-item.active .step-circle {
-        background: linear-gradient(135deg, #6366F1 0%, #8B5CF6 100%);
-        border-color: #8B5CF6;
-        color: white;
-        box-shadow: 0 0 15px rgba(139, 92, 246, 0.5);
-    }
-    
-    .step-item.completed .step-circle {
-        background: #10B981;
-        border-color: #10B981;
-        color: white;
-    }
-    
-    .step-label {
-        font-size: 0.85rem;
-        color: #64748B;
-        font-weight: 500;
-        transition: all 0.3s ease;
-    }
-    
-    .step-item.active .step-label {
-        color: #E2E8F0;
-        font-weight: 700;
-    }
-    
-    .step-line {
-        height: 2px;
-        background: #334155;
-        flex-grow: 1;
-        max-width: 100px;
-        margin: 0 -30px 25px -30px;
-        z-index: 1;
-    }
-    
-    .step-line.active {
-        background: linear-gradient(90deg, #10B981 0%, #6366F1 100%);
-    }
-
-    /* Glass Cards */
-    .glass-card {
-        background: rgba(30, 41, 59, 0.4);
-        backdrop-filter: blur(12px);
-        -webkit-backdrop-filter: blur(12px);
-        border-radius: 20px;
-        padding: 2rem;
-        border: 1px solid rgba(255, 255, 255, 0.05);
-        box-shadow: 0 25px 50px -12px rgba(0, 0, 0, 0.25);
-        margin-bottom: 2rem;
-    }
-
-    /* Upload Zone */
-    .upload-zone {
-        border: 2px dashed #475569;
-        border-radius: 20px;
-        padding: 4rem 2rem;
-        text-align: center;
-        background: rgba(15, 23, 42, 0.5);
-        transition: all 0.3s cubic-bezier(0.4, 0, 0.2, 1);
-        cursor: pointer;
-    }
-    
-    .upload-zone:hover {
-        border-color: #8B5CF6;
-        background: rgba(139, 92, 246, 0.05);
-        transform: translateY(-2px);
-    }
-
-    /* Buttons */
-    .stButton > button {
-        background: #1E293B;
-        color: #E2E8F0;
-        border: 1px solid #475569;
-        border-radius: 12px;
-        padding: 0.75rem 1.5rem;
-        font-weight: 600;
-        transition: all 0.2s ease;
-        box-shadow: 0 4px 6px -1px rgba(0, 0, 0, 0.1);
-    }
-    
-    .stButton > button:hover {
-        border-color: #8B5CF6;
-        color: #8B5CF6;
-        background: #0F172A;
-        transform: translateY(-1px);
-        box-shadow: 0 10px 15px -3px rgba(0, 0, 0, 0.1);
-    }
-    
-    /* Primary Action Buttons (e.g., Translate All, Export) */
-    div[data-testid="stColumn"] > div > div > div > div > div > button {
-        /* Generic selector backup, specifics handled by Python layout */
-    }
 
-    /* UI Components Overrides */
-    
-    /* Input Fields */
-    .stTextInput > div > div > input {
-        background-color: #1E293B;
-        border-color: #475569;
-        color: #E2E8F0;
-        border-radius: 10px;
-    }
-    .stTextInput > div > div > input:focus {
-        border-color: #8B5CF6;
-        box-shadow: 0 0 0 1px #8B5CF6;
-    }
+@st.cache_data
+def load_css() -> str:
+    """Đọc styles.css một lần cho cả process và bọc trong thẻ <style>"""
+    with open(CSS_PATH, "r", encoding="utf-8") as f:
+        return f"<style>\n{f.read()}</style>"
 
-    /* Select Box */
-    .stSelectbox > div > div > div {
-        background-color: #1E293B;
-        border-color: #475569;
-        color: #E2E8F0;
-        border-radius: 10px;
-    }
 
-    /* Expander */
-    .streamlit-expanderHeader {
-        background-color: #1E293B;
-        border-radius: 10px;
-        border: 1px solid #334155;
-    }
-
-    /* Data Editor */
-    div[data-testid="stDataEditor"] {
-        border-radius: 15px;
-        border: 1px solid #334155;
-        overflow: hidden;
-    }
-
-    /* Progress Bar */
-    .stProgress > div > div > div > div {
-        background: linear-gradient(90deg, #6366F1 0%, #EC4899 100%);
-    }
-
-    /* Sidebar */
-    [data-testid="stSidebar"] {
-        background-color: #0B1120;
-        border-right: 1px solid #1E293B;
-    }
+def inject_css():
+    """
+    Chèn custom CSS
     
-    /* Hide Default Elements */
-    #MainMenu {visibility: hidden;}
-    footer {visibility: hidden;}
-</style>
-""", unsafe_allow_html=True)
+    Phải gọi ở mỗi lần rerun: Streamlit xóa các element không được render lại,
+    nên không thể chỉ inject một lần rồi đánh dấu trong session_state.
+    """
+    st.markdown(load_css(), unsafe_allow_html=True)
 
 
 # ============================================
@@ -279,15 +80,27 @@ def init_session_state():
         'segments': [],
         'video_info': {},
         'processing': False,
+        'segments_version': 0,
+        'jobs': {},
+        'transcribe_job': None,
+        'export_job': None,
+        'export_output': None,
+        'session_dir': None,
         'openrouter_key': '',
         'tts_key': '',
         'whisper_model': DEFAULTS['whisper_model'],
+        'compute_type': DEFAULTS['compute_type'],
         'translation_model': DEFAULTS['translation_model'],
+        'translation_batch_size': DEFAULTS['translation_batch_size'],
+        'translation_workers': DEFAULTS['translation_workers'],
         'tts_provider': DEFAULTS['tts_provider'],
         'voice': DEFAULTS['voice'],
         'speed': DEFAULTS['speed'],
         'original_volume': DEFAULTS['original_volume'],
-        'dubbed_volume': DEFAULTS.get('dubbed_volume', 1.0)
+        'dubbed_volume': DEFAULTS.get('dubbed_volume', 1.0),
+        'tts_workers': DEFAULTS['tts_workers'],
+        'whisper_batch_size': DEFAULTS['whisper_batch_size'],
+        'video_encoder': DEFAULTS['video_encoder']
     }
     
     for key, value in defaults.items():
@@ -298,6 +111,233 @@ def init_session_state():
 init_session_state()
 
 
+def mark_segments_changed():
+    """Tăng version mỗi khi segments bị sửa (transcribe, dịch, TTS) để invalidate cache"""
+    st.session_state.segments_version += 1
+
+
+def get_session_dir() -> str:
+    """Thư mục temp riêng của session (video, preview, export), tạo lại nếu đã bị xóa"""
+    path = st.session_state.session_dir
+    if not path or not os.path.isdir(path):
+        path = create_session_dir()
+        st.session_state.session_dir = path
+    return path
+
+
+def reset_session_dir():
+    """Xóa toàn bộ file tạm của session khi quay lại Bước 1"""
+    # Export đang chạy sẽ ghi vào thư mục bị xóa -> bỏ job đi
+    background.cancel_job(st.session_state.jobs, st.session_state.export_job)
+    st.session_state.export_job = None
+    
+    if st.session_state.session_dir:
+        shutil.rmtree(st.session_state.session_dir, ignore_errors=True)
+    st.session_state.session_dir = None
+    st.session_state.video_path = None
+    st.session_state.preview_path = None
+    st.session_state.export_output = None
+
+
+def get_segments_frame() -> pd.DataFrame:
+    """
+    Bản columnar (một cột/field) của segments, build lại khi segments_version thay đổi
+    
+    segments (list dict) vẫn là dữ liệu gốc mà core modules dùng; frame này phục vụ
+    các phép đếm/lọc vectorized và làm nguồn cho data editor.
+    """
+    version = st.session_state.segments_version
+    if st.session_state.get('segments_frame_version') != version:
+        frame = pd.DataFrame.from_records(
+            st.session_state.segments,
+            columns=["id", "start", "end", "text", "vietnamese", "audio_path"]
+        )
+        frame["vietnamese"] = frame["vietnamese"].fillna("")
+        frame["audio_path"] = frame["audio_path"].fillna("")
+        st.session_state.segments_frame = frame
+        st.session_state.segments_frame_version = version
+    
+    return st.session_state.segments_frame
+
+
+def get_segment_stats():
+    """
+    (tổng, đã dịch, có audio)
+    
+    Chỉ đếm lại (vectorized trên segments frame) khi segments_version thay đổi,
+    các lần rerun khác đọc counter đã lưu trong session_state.
+    """
+    version = st.session_state.segments_version
+    if st.session_state.get('segment_stats_version') != version:
+        frame = get_segments_frame()
+        st.session_state.segment_stats = (
+            len(frame),
+            int(frame["vietnamese"].ne("").sum()),
+            int(frame["audio_path"].ne("").sum())
+        )
+        st.session_state.segment_stats_version = version
+    
+    return st.session_state.segment_stats
+
+
+def is_ready_for_export() -> bool:
+    """Đủ điều kiện sang Bước 3: đã có bản dịch và audio"""
+    _, translated, has_audio = get_segment_stats()
+    return bool(translated and has_audio)
+
+
+def audio_text_hash(text: str) -> str:
+    """Hash của text + cấu hình giọng, dùng để biết audio của segment còn đúng không"""
+    key = f"{st.session_state.tts_provider}|{st.session_state.voice}|{st.session_state.speed}|{text}"
+    return hashlib.md5(key.encode('utf-8')).hexdigest()
+
+
+def get_editor_df() -> pd.DataFrame:
+    """DataFrame cho data editor, chỉ build lại khi segments_version thay đổi"""
+    version = st.session_state.segments_version
+    if st.session_state.get('editor_df_version') != version:
+        records = get_segments_frame()
+        
+        def timecode(col: pd.Series) -> pd.Series:
+            minutes = (col // 60).astype(int).astype(str).str.zfill(2)
+            secs = (col % 60).astype(int).astype(str).str.zfill(2)
+            return minutes + ":" + secs
+        
+        st.session_state.editor_df = pd.DataFrame({
+            "ID": records["id"],
+            "Timecode": timecode(records["start"]) + " - " + timecode(records["end"]),
+            "English": records["text"],
+            "Vietnamese": records["vietnamese"],
+            "Has Audio": records["audio_path"].ne("").map({True: "✅", False: "❌"})
+        })
+        st.session_state.editor_df_version = version
+    
+    return st.session_state.editor_df
+
+
+def is_fragment_rerun() -> bool:
+    """True nếu lần chạy hiện tại là rerun riêng của fragment (không phải rerun cả app)"""
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+    ctx = get_script_run_ctx()
+    if ctx is None:
+        return False
+    # Streamlit >= 1.38 ghi fragment_ids_this_run, 1.37 chỉ có fragment_id_queue
+    # (chính là điều kiện st.rerun(scope="fragment") kiểm tra ở bản này)
+    if getattr(ctx, "fragment_ids_this_run", None):
+        return True
+    script_requests = getattr(ctx, "script_requests", None)
+    return bool(script_requests and getattr(script_requests, "fragment_id_queue", None))
+
+
+def poll_job(job_key: str, label: str, scope: str = "app"):
+    """
+    Theo dõi job nền có ID lưu trong st.session_state[job_key]
+    
+    Khi job còn chạy: hiển thị trạng thái + nút hủy rồi rerun sau 1s (hàm không return).
+    Khi job xong: trả về Future. Trả về None nếu job không còn tồn tại.
+    
+    Args:
+        job_key: Key trong session_state chứa job ID
+        label: Nhãn hiển thị trên status box
+        scope: Phạm vi rerun ("app" hoặc "fragment" khi gọi trong fragment).
+            "fragment" chỉ dùng được trong lần rerun của fragment; nếu fragment
+            đang chạy trong một lần rerun cả app thì tự chuyển về "app".
+    """
+    if scope == "fragment" and not is_fragment_rerun():
+        scope = "app"
+    
+    jobs = st.session_state.jobs
+    job_id = st.session_state[job_key]
+    future = background.get_job(jobs, job_id)
+    
+    if future is None:
+        st.session_state[job_key] = None
+        return None
+    
+    if future.done():
+        background.pop_job(jobs, job_id)
+        st.session_state[job_key] = None
+        return future
+    
+    with st.status(label, expanded=True):
+        st.write("⏳ Đang chạy nền, bạn vẫn có thể thao tác trên giao diện...")
+        if st.button("✖️ Hủy", key=f"cancel_{job_key}"):
+            background.cancel_job(jobs, job_id)
+            st.session_state[job_key] = None
+            st.rerun(scope=scope)
+    
+    time.sleep(1)
+    st.rerun(scope=scope)
+
+
+# ============================================
+# CACHED OPERATIONS
+# ============================================
+
+@st.cache_resource(show_spinner=False)
+def _cached_tts_provider(provider_name: str, api_key: str):
+    """Giữ TTS provider (và HTTP session của nó) qua các lần rerun"""
+    from core.tts import get_tts_provider
+    return get_tts_provider(provider_name, api_key)
+
+
+@st.cache_resource(show_spinner=False)
+def _cached_openrouter_session():
+    """HTTP session (connection pool) dùng chung cho các request dịch"""
+    from utils.http_utils import create_session
+    return create_session()
+
+
+@st.cache_resource(show_spinner=False, max_entries=1)
+def _read_output(path: str, mtime: float) -> bytes:
+    """
+    Đọc file video đã export một lần, không đọc lại mỗi lần rerun (mtime để invalidate)
+
+    cache_resource trả về chính object bytes đã đọc, không pickle/unpickle
+    thêm một bản sao mỗi lần rerun như cache_data.
+    """
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def _build_srt(segments_key: tuple) -> str:
+    """
+    Nội dung SRT, cache theo (start, end, text) của từng segment
+    
+    Bấm Export SRT nhiều lần với cùng nội dung không phải format lại.
+    """
+    return create_srt_text([
+        {"start": start, "end": end, "vietnamese": text}
+        for start, end, text in segments_key
+    ])
+
+
+@st.cache_data(show_spinner=False, max_entries=8, persist="disk")
+def _cached_transcribe(
+    file_hash: str,
+    model_name: str,
+    compute_type: str,
+    language: str,
+    batch_size: int,
+    _video_path: str
+):
+    """
+    Transcribe video, cache (lưu cả trên đĩa) theo fingerprint file + model + ngôn ngữ
+
+    Model Whisper chỉ được cache ở core.transcriber (lru_cache, tối đa 2 model)
+    để unload_whisper_model() giải phóng được RAM/VRAM.
+    """
+    from core.transcriber import transcribe_video
+    return transcribe_video(
+        _video_path,
+        model_name=model_name,
+        language=language,
+        batch_size=batch_size,
+        compute_type=compute_type
+    )
+
+
 # ============================================
 # SIDEBAR - SETTINGS
 # ============================================
@@ -345,12 +385,37 @@ def render_sidebar():
                 help="Model lớn hơn = chính xác hơn nhưng chậm hơn"
             )
             
+            st.session_state.compute_type = st.selectbox(
+                "Whisper Precision",
+                options=list(COMPUTE_TYPES.keys()),
+                format_func=lambda x: COMPUTE_TYPES[x],
+                index=list(COMPUTE_TYPES.keys()).index(st.session_state.compute_type),
+                help="int8 giảm một nửa bộ nhớ và tăng tốc đáng kể trên CPU"
+            )
+            
             st.session_state.translation_model = st.selectbox(
                 "Translation Model",
                 options=list(TRANSLATION_MODELS.keys()),
                 format_func=lambda x: TRANSLATION_MODELS[x],
                 index=list(TRANSLATION_MODELS.keys()).index(st.session_state.translation_model)
             )
+            
+            st.session_state.translation_batch_size = st.slider(
+                "Số câu mỗi request dịch",
+                min_value=5,
+                max_value=50,
+                value=st.session_state.translation_batch_size,
+                step=5,
+                help="Batch lớn = ít request hơn, nhưng response dài dễ bị lỗi JSON"
+            )
+            
+            st.session_state.translation_workers = st.slider(
+                "Số request dịch song song",
+                min_value=1,
+                max_value=8,
+                value=st.session_state.translation_workers,
+                help="Model free thường bị giới hạn rate, nên để thấp"
+            )
         
         # Voice Settings
         with st.expander("🎤 Voice Settings", expanded=False):
@@ -374,6 +439,15 @@ def render_sidebar():
                 value=st.session_state.speed,
                 step=0.1
             )
+            
+            st.session_state.tts_workers = st.slider(
+                "Số request TTS song song",
+                min_value=1,
+                max_value=16,
+                value=st.session_state.tts_workers,
+                step=1,
+                help="Giảm xuống nếu provider báo lỗi rate limit"
+            )
         
         # Audio Mixing
         with st.expander("🔊 Audio Mixing", expanded=False):
@@ -394,6 +468,50 @@ def render_sidebar():
                 step=0.1
             )
         
+        # Export Settings
+        with st.expander("🎞️ Export Settings", expanded=False):
+            st.session_state.video_encoder = st.selectbox(
+                "Video Encoder",
+                options=list(VIDEO_ENCODERS.keys()),
+                format_func=lambda x: VIDEO_ENCODERS[x],
+                index=list(VIDEO_ENCODERS.keys()).index(st.session_state.video_encoder),
+                help="GPU encode nhanh hơn nhiều với video dài, chọn libx264 nếu cần chất lượng tốt nhất"
+            )
+        
+        # Cache
+        with st.expander("🗄️ Cache", expanded=False):
+            if st.button(
+                "🗑️ Xóa cache bản dịch",
+                use_container_width=True,
+                help="Dịch lại từ đầu thay vì dùng bản dịch đã lưu"
+            ):
+                clear_translation_cache()
+                st.success("Đã xóa cache bản dịch")
+            
+            if st.button(
+                "🗑️ Xóa cache audio TTS",
+                use_container_width=True,
+                help="Xóa các file audio đã generate (thư mục tts_cache), cần Generate lại audio"
+            ):
+                clear_tts_cache()
+                # Audio của session trỏ vào file trong cache, không còn dùng được
+                for seg in st.session_state.segments:
+                    seg["audio_path"] = ""
+                    seg["audio_text_hash"] = ""
+                mark_segments_changed()
+                st.success("Đã xóa cache audio TTS")
+            
+            if st.button(
+                "🧹 Giải phóng model Whisper",
+                use_container_width=True,
+                help="Bỏ các model Whisper đang giữ trong RAM/VRAM, lần transcribe sau sẽ load lại"
+            ):
+                # Chỉ cần khi transcriber đã được import (model chỉ load qua module này)
+                transcriber = sys.modules.get("core.transcriber")
+                if transcriber is not None:
+                    transcriber.unload_whisper_model()
+                st.success("Đã giải phóng model Whisper")
+        
         # System Info
         st.markdown("---")
         st.markdown("### 📊 Trạng thái")
@@ -419,6 +537,20 @@ def render_step1():
     """Step 1: Upload video và transcribe"""
     st.markdown("### 📥 Bước 1: Nhập Video")
     
+    # Transcribe đang chạy nền
+    if st.session_state.transcribe_job:
+        future = poll_job('transcribe_job', f"🎙️ Đang transcribe với {st.session_state.whisper_model}...")
+        if future is not None:
+            try:
+                st.session_state.segments = future.result()
+                mark_segments_changed()
+                
+                # Move to step 2
+                st.session_state.current_step = 2
+                st.rerun()
+            except Exception as e:
+                st.error(f"Lỗi: {str(e)}")
+    
     col1, col2 = st.columns([2, 1])
     
     with col1:
@@ -455,6 +587,14 @@ def render_step1():
             horizontal=False
         )
         st.session_state.whisper_model = quick_model
+        
+        st.session_state.whisper_batch_size = st.slider(
+            "Batch size",
+            min_value=1,
+            max_value=32,
+            value=st.session_state.whisper_batch_size,
+            help="Số đoạn audio decode cùng lúc. Giảm nếu thiếu RAM/VRAM"
+        )
     
     # Process button
     st.markdown("---")
@@ -467,10 +607,13 @@ def render_step1():
                 # Handle upload or download
                 if uploaded_file:
                     st.write("📁 Đang lưu file...")
-                    st.session_state.video_path = save_uploaded_file(uploaded_file)
+                    st.session_state.video_path = save_uploaded_file(uploaded_file, get_session_dir())
                 elif youtube_url:
                     st.write("📥 Đang tải video từ YouTube...")
-                    st.session_state.video_path = download_youtube(youtube_url)
+                    st.session_state.video_path = download_youtube(
+                        youtube_url,
+                        os.path.join(get_session_dir(), "%(title)s.%(ext)s")
+                    )
                 
                 if not st.session_state.video_path:
                     st.error("Không thể xử lý video!")
@@ -478,20 +621,24 @@ def render_step1():
                 
                 # Get video info
                 st.write("📊 Đang phân tích video...")
-                st.session_state.video_info = get_video_info(st.session_state.video_path)
+                video_path = st.session_state.video_path
+                # get_video_info đã cache theo (path, size, mtime)
+                st.session_state.video_info = get_video_info(video_path)
                 
-                # Transcribe
+                # Transcribe trong background (kết quả được xử lý ở đầu render_step1).
+                # Model chỉ được load khi _cached_transcribe thực sự chạy (cache miss)
                 st.write(f"🎙️ Đang transcribe với {st.session_state.whisper_model}...")
-                st.session_state.segments = transcribe_video(
-                    st.session_state.video_path,
-                    model_name=st.session_state.whisper_model,
-                    language='en'
+                st.session_state.transcribe_job = background.submit(
+                    st.session_state.jobs,
+                    _cached_transcribe,
+                    file_fingerprint(st.session_state.video_path),
+                    st.session_state.whisper_model,
+                    st.session_state.compute_type,
+                    'en',
+                    st.session_state.whisper_batch_size,
+                    st.session_state.video_path
                 )
-                
-                status.update(label=f"✅ Hoàn tất! Tìm thấy {len(st.session_state.segments)} đoạn.", state="complete")
-                
-                # Move to step 2
-                st.session_state.current_step = 2
+                status.update(label="🎙️ Đã bắt đầu transcribe", state="running")
                 st.rerun()
                 
             except Exception as e:
@@ -502,13 +649,20 @@ def render_step1():
 # STEP 2: EDITOR (GOD MODE)
 # ============================================
 
+@st.fragment
 def render_step2():
-    """Step 2: Editor - Dịch và chỉnh sửa"""
+    """
+    Step 2: Editor - Dịch và chỉnh sửa
+    
+    Chạy dưới dạng fragment: các nút công cụ chỉ rerun phần thân bước này,
+    chuyển bước mới rerun cả app (step indicator thay đổi).
+    """
     st.markdown("### ✏️ Bước 2: Chỉnh sửa & Dịch thuật")
     
     if not st.session_state.segments:
         st.warning("Chưa có dữ liệu transcription. Quay lại Bước 1.")
         if st.button("⬅️ Quay lại Bước 1"):
+            reset_session_dir()
             st.session_state.current_step = 1
             st.rerun()
         return
@@ -526,10 +680,14 @@ def render_step2():
             else:
                 with st.spinner("Đang dịch..."):
                     try:
+                        from core.translator import translate_segments, estimate_cost
+                        
                         # Estimate cost
                         cost = estimate_cost(
                             st.session_state.segments,
-                            st.session_state.translation_model
+                            st.session_state.translation_model,
+                            fast_estimate=True,
+                            batch_size=st.session_state.translation_batch_size
                         )
                         st.info(f"💰 Chi phí ước tính: ${cost:.4f}")
                         
@@ -537,10 +695,14 @@ def render_step2():
                         st.session_state.segments = translate_segments(
                             st.session_state.segments,
                             st.session_state.openrouter_key,
-                            st.session_state.translation_model
+                            st.session_state.translation_model,
+                            batch_size=st.session_state.translation_batch_size,
+                            max_workers=st.session_state.translation_workers,
+                            session=_cached_openrouter_session()
                         )
+                        mark_segments_changed()
                         st.success("✅ Dịch xong!")
-                        st.rerun()
+                        st.rerun(scope="fragment")
                     except Exception as e:
                         st.error(f"Lỗi dịch: {str(e)}")
     
@@ -553,41 +715,58 @@ def render_step2():
                 status_text = st.empty()
                 
                 try:
-                    total = len(st.session_state.segments)
-                    for i, seg in enumerate(st.session_state.segments):
-                        status_text.text(f"Generating audio {i+1}/{total}...")
-                        progress_bar.progress((i + 1) / total)
-                        
-                        # Generate audio for this segment
-                        provider = get_tts_provider(
+                    from core.tts import generate_all_audio
+                    
+                    def has_current_audio(seg) -> bool:
+                        # Bỏ qua đoạn đã có audio cho đúng text/voice/speed hiện tại
+                        text = seg.get("vietnamese") or seg.get("text", "")
+                        return (seg.get("audio_text_hash") == audio_text_hash(text)
+                                and bool(seg.get("audio_path"))
+                                and os.path.exists(seg["audio_path"]))
+                    
+                    def on_progress(message: str, progress: float):
+                        status_text.text(message)
+                        progress_bar.progress(progress)
+                    
+                    # Gửi song song các request TTS (I/O-bound), không vượt quá số request
+                    # song song provider chấp nhận. Đoạn nào có cùng text/voice/speed với
+                    # lần trước sẽ lấy từ cache, không gọi API
+                    segments = generate_all_audio(
+                        st.session_state.segments,
+                        st.session_state.tts_provider,
+                        st.session_state.tts_key,
+                        st.session_state.voice,
+                        speed=st.session_state.speed,
+                        # Giữ hành vi cũ: không tự tăng tốc audio cho vừa khoảng trống
+                        fit_duration=False,
+                        progress_callback=on_progress,
+                        max_workers=st.session_state.tts_workers,
+                        provider=_cached_tts_provider(
                             st.session_state.tts_provider,
                             st.session_state.tts_key
-                        )
+                        ),
+                        skip_segment=has_current_audio,
+                        output_dir=get_session_dir()
+                    )
+                    for seg in segments:
                         text = seg.get("vietnamese") or seg.get("text", "")
-                        if text:
-                            audio_path = provider.synthesize(
-                                text,
-                                st.session_state.voice,
-                                st.session_state.speed
-                            )
-                            seg["audio_path"] = audio_path or ""
+                        seg["audio_text_hash"] = audio_text_hash(text) if seg.get("audio_path") else ""
                     
+                    mark_segments_changed()
                     st.success("✅ Generate audio xong!")
-                    st.rerun()
+                    st.rerun(scope="fragment")
                 except Exception as e:
                     st.error(f"Lỗi TTS: {str(e)}")
     
     with col3:
         if st.button("⬅️ Quay lại Bước 1", use_container_width=True):
+            reset_session_dir()
             st.session_state.current_step = 1
             st.rerun()
     
     with col4:
         # Check if ready for step 3
-        has_translations = any(seg.get("vietnamese") for seg in st.session_state.segments)
-        has_audio = any(seg.get("audio_path") for seg in st.session_state.segments)
-        
-        if st.button("➡️ Tiếp tục Export", disabled=not (has_translations and has_audio), use_container_width=True):
+        if st.button("➡️ Tiếp tục Export", disabled=not is_ready_for_export(), use_container_width=True):
             st.session_state.current_step = 3
             st.rerun()
             
@@ -595,59 +774,86 @@ def render_step2():
     
     st.markdown("---")
     
-    # Create DataFrame for editing
-    df_data = []
-    for seg in st.session_state.segments:
-        df_data.append({
-            "ID": seg["id"],
-            "Timecode": format_timecode_range(seg["start"], seg["end"]),
-            "English": seg["text"],
-            "Vietnamese": seg.get("vietnamese", ""),
-            "Has Audio": "✅" if seg.get("audio_path") else "❌"
-        })
+    render_editor()
+
+
+@st.fragment
+def render_editor():
+    """
+    Bảng chỉnh sửa + thống kê
     
-    df = pd.DataFrame(df_data)
-    
-    # Editable dataframe
-    edited_df = st.data_editor(
-        df,
-        use_container_width=True,
-        num_rows="fixed",
-        column_config={
-            "ID": st.column_config.NumberColumn("ID", disabled=True, width="small"),
-            "Timecode": st.column_config.TextColumn("⏱️ Timecode", disabled=True, width="medium"),
-            "English": st.column_config.TextColumn("🇬🇧 English", disabled=True),
-            "Vietnamese": st.column_config.TextColumn("🇻🇳 Vietnamese", width="large"),
-            "Has Audio": st.column_config.TextColumn("🎵", disabled=True, width="small")
-        },
-        hide_index=True,
-        height=500
-    )
+    Chạy dưới dạng fragment: apply chỉ rerun phần này, không rerun sidebar,
+    step indicator và các nút công cụ. Editor nằm trong form nên sửa từng ô
+    không gây rerun, mọi thay đổi được gom lại và ghi một lần khi bấm Apply.
+    """
+    # DataFrame cho editor (cache theo segments_version)
+    df = get_editor_df()
     
-    # Update segments from edited DataFrame
-    for i, row in edited_df.iterrows():
-        if i < len(st.session_state.segments):
-            st.session_state.segments[i]["vietnamese"] = row["Vietnamese"]
+    with st.form("editor_form", clear_on_submit=False, border=False):
+        # Editable dataframe
+        edited_df = st.data_editor(
+            df,
+            use_container_width=True,
+            num_rows="fixed",
+            column_config={
+                "ID": st.column_config.NumberColumn("ID", disabled=True, width="small"),
+                "Timecode": st.column_config.TextColumn("⏱️ Timecode", disabled=True, width="medium"),
+                "English": st.column_config.TextColumn("🇬🇧 English", disabled=True),
+                "Vietnamese": st.column_config.TextColumn("🇻🇳 Vietnamese", width="large"),
+                "Has Audio": st.column_config.TextColumn("🎵", disabled=True, width="small")
+            },
+            hide_index=True,
+            height=500
+        )
+        submitted = st.form_submit_button("💾 Áp dụng chỉnh sửa")
     
-    # Statistics
+    # Update segments from edited DataFrame (chỉ khi submit và user có sửa)
+    if submitted and not edited_df["Vietnamese"].equals(df["Vietnamese"]):
+        vietnamese = edited_df["Vietnamese"].to_numpy()
+        was_ready = is_ready_for_export()
+        changed = False
+        for seg, text in zip(st.session_state.segments, vietnamese):
+            if seg.get("vietnamese") != text:
+                seg["vietnamese"] = text
+                # Audio cũ không còn khớp với text mới
+                seg["audio_path"] = ""
+                changed = True
+        
+        if changed:
+            mark_segments_changed()
+            # Nút "Tiếp tục Export" nằm ngoài fragment này: khi trạng thái sẵn sàng
+            # thay đổi thì rerun cả app để nút được bật/tắt lại
+            st.rerun(scope="fragment" if is_ready_for_export() == was_ready else "app")
+    
+    # Statistics (nằm trong fragment để cập nhật ngay khi sửa)
+    render_segment_stats()
+
+
+def render_segment_stats():
+    """Hiển thị thống kê segments"""
     st.markdown("---")
+    total, translated, has_audio = get_segment_stats()
     col1, col2, col3 = st.columns(3)
     with col1:
-        st.metric("📝 Tổng đoạn", len(st.session_state.segments))
+        st.metric("📝 Tổng đoạn", total)
     with col2:
-        translated = sum(1 for seg in st.session_state.segments if seg.get("vietnamese"))
-        st.metric("🌐 Đã dịch", f"{translated}/{len(st.session_state.segments)}")
+        st.metric("🌐 Đã dịch", f"{translated}/{total}")
     with col3:
-        has_audio = sum(1 for seg in st.session_state.segments if seg.get("audio_path"))
-        st.metric("🎵 Có audio", f"{has_audio}/{len(st.session_state.segments)}")
+        st.metric("🎵 Có audio", f"{has_audio}/{total}")
 
 
 # ============================================
 # STEP 3: PREVIEW & EXPORT
 # ============================================
 
+@st.fragment
 def render_step3():
-    """Step 3: Preview và Export"""
+    """
+    Step 3: Preview và Export
+    
+    Chạy dưới dạng fragment giống Step 2: preview, export và polling job
+    export chỉ rerun phần thân bước này.
+    """
     st.markdown("### 🎬 Bước 3: Preview & Export")
     
     if not st.session_state.segments:
@@ -671,9 +877,7 @@ def render_step3():
         st.markdown("#### 📊 Thống kê")
         
         # Stats
-        total_segments = len(st.session_state.segments)
-        translated = sum(1 for seg in st.session_state.segments if seg.get("vietnamese"))
-        has_audio = sum(1 for seg in st.session_state.segments if seg.get("audio_path"))
+        total_segments, translated, has_audio = get_segment_stats()
         
         st.metric("Tổng đoạn", total_segments)
         st.metric("Đã dịch", f"{translated}/{total_segments}")
@@ -733,16 +937,15 @@ def render_step3():
             
             with st.status("Đang tạo preview 60s...", expanded=True) as status:
                 try:
-                    ensure_temp_dir()
-                    preview_path = os.path.join(TEMP_DIR, "preview_60s.mp4")
+                    preview_path = os.path.join(get_session_dir(), "preview_60s.mp4")
                     
                     st.write("🎬 Đang render 60 giây đầu tiên...")
                     
-                    # Filter segments trong 60s đầu
-                    preview_segments = [
-                        seg for seg in st.session_state.segments 
-                        if seg["start"] < 60
-                    ]
+                    # Segments trong 60s đầu: Whisper trả về theo thứ tự start
+                    # nên chỉ cần binary search rồi cắt list
+                    frame = get_segments_frame()
+                    end = int(frame["start"].searchsorted(60, side="left"))
+                    preview_segments = st.session_state.segments[:end]
                     
                     success = export_video(
                         st.session_state.video_path,
@@ -753,13 +956,14 @@ def render_step3():
                         burn_subtitles=burn_subs,
                         preview_duration=60,  # Chỉ render 60s
                         font_size=font_size,
-                        max_line_width=max_width
+                        max_line_width=max_width,
+                        video_encoder=st.session_state.video_encoder
                     )
                     
                     if success and os.path.exists(preview_path):
                         status.update(label="✅ Preview sẵn sàng!", state="complete")
                         st.session_state.preview_path = preview_path
-                        st.rerun()
+                        st.rerun(scope="fragment")
                     else:
                         st.error("Tạo preview thất bại.")
                         
@@ -769,12 +973,11 @@ def render_step3():
     with col3:
         if st.button("📄 Export SRT", use_container_width=True):
             try:
-                ensure_temp_dir()
-                srt_path = os.path.join(TEMP_DIR, "subtitles.srt")
-                create_srt_file(st.session_state.segments, srt_path)
-                
-                with open(srt_path, 'r', encoding='utf-8') as f:
-                    srt_content = f.read()
+                # Build trực tiếp trong bộ nhớ, không ghi ra file rồi đọc lại
+                srt_content = _build_srt(tuple(
+                    (seg["start"], seg["end"], seg.get("vietnamese") or seg.get("text", ""))
+                    for seg in st.session_state.segments
+                ))
                 
                 st.download_button(
                     label="⬇️ Download SRT",
@@ -787,50 +990,46 @@ def render_step3():
                 st.error(f"Lỗi export SRT: {str(e)}")
     
     with col4:
-        if st.button("🎬 Export Full Video", use_container_width=True, type="primary"):
+        if st.button(
+            "🎬 Export Full Video",
+            use_container_width=True,
+            type="primary",
+            disabled=bool(st.session_state.export_job)
+        ):
             if not check_ffmpeg_installed():
                 st.error("FFmpeg chưa được cài đặt. Vui lòng cài FFmpeg trước.")
                 return
             
-            with st.status("Đang render video...", expanded=True) as status:
-                try:
-                    ensure_temp_dir()
-                    # Determine extension based on format
-                    ext = output_format.lower()
-                    output_filename = f"vietdub_output.{ext}"
-                    output_path = os.path.join(TEMP_DIR, output_filename)
-                    
-                    st.write("📹 Đang ghép audio...")
-                    
-                    success = export_video(
-                        st.session_state.video_path,
-                        st.session_state.segments,
-                        output_path,
-                        original_volume=st.session_state.original_volume,
-                        dubbed_volume=st.session_state.dubbed_volume,
-                        burn_subtitles=burn_subs,
-                        font_size=font_size,
-                        max_line_width=max_width
-                    )
-                    
-                    if success and os.path.exists(output_path):
-                        status.update(label="✅ Export thành công!", state="complete")
-                        
-                        # Determine mime type
-                        mime_type = "video/mp4" if ext == "mp4" else "video/x-matroska"
-                        
-                        with open(output_path, 'rb') as f:
-                            st.download_button(
-                                label=f"⬇️ Download Video ({output_format})",
-                                data=f.read(),
-                                file_name=output_filename,
-                                mime=mime_type
-                            )
-                    else:
-                        st.error("Export thất bại. Kiểm tra FFmpeg và thử lại.")
-                        
-                except Exception as e:
-                    st.error(f"Lỗi export: {str(e)}")
+            try:
+                # Determine extension based on format
+                ext = output_format.lower()
+                # Mỗi job một file riêng: job đã hủy vẫn có thể còn ffmpeg ghi vào file cũ
+                output_filename = f"vietdub_output_{uuid.uuid4().hex[:8]}.{ext}"
+                output_path = os.path.join(get_session_dir(), output_filename)
+                
+                # Render trong background, truyền bản copy segments để editor sửa không ảnh hưởng
+                st.session_state.export_output = {
+                    "path": output_path,
+                    "format": output_format,
+                    "done": False
+                }
+                st.session_state.export_job = background.submit(
+                    st.session_state.jobs,
+                    export_video,
+                    st.session_state.video_path,
+                    [dict(seg) for seg in st.session_state.segments],
+                    output_path,
+                    original_volume=st.session_state.original_volume,
+                    dubbed_volume=st.session_state.dubbed_volume,
+                    burn_subtitles=burn_subs,
+                    font_size=font_size,
+                    max_line_width=max_width,
+                    video_encoder=st.session_state.video_encoder
+                )
+                st.rerun(scope="fragment")
+                
+            except Exception as e:
+                st.error(f"Lỗi export: {str(e)}")
                     
     st.markdown('</div>', unsafe_allow_html=True)
     
@@ -839,32 +1038,62 @@ def render_step3():
         st.markdown("---")
         st.markdown("#### 🎬 Preview Video (60s đầu tiên)")
         st.video(st.session_state.preview_path)
+    
+    # Export đang chạy nền
+    export_output = st.session_state.export_output
+    if st.session_state.export_job:
+        future = poll_job('export_job', "🎬 Đang render video...", scope="fragment")
+        if future is not None:
+            try:
+                if future.result() and os.path.exists(export_output["path"]):
+                    export_output["done"] = True
+                else:
+                    st.error("Export thất bại. Kiểm tra FFmpeg và thử lại.")
+            except Exception as e:
+                st.error(f"Lỗi export: {str(e)}")
+    
+    # Download video đã export
+    if export_output and export_output["done"] and os.path.exists(export_output["path"]):
+        st.markdown("---")
+        st.success("✅ Export thành công!")
+        
+        # Determine mime type
+        ext = export_output["format"].lower()
+        mime_type = "video/mp4" if ext == "mp4" else "video/x-matroska"
+        
+        output_path = export_output["path"]
+        st.download_button(
+            label=f"⬇️ Download Video ({export_output['format']})",
+            data=_read_output(output_path, os.path.getmtime(output_path)),
+            file_name=f"vietdub_output.{ext}",
+            mime=mime_type
+        )
 
 
 # ============================================
 # MAIN APP
 # ============================================
 
-def main():
-    """Main application"""
-    # Render sidebar
-    render_sidebar()
+@st.cache_data
+def step_indicator_html(current_step: int) -> str:
+    """
+    HTML của thanh step indicator
     
-    # Header
-    st.markdown('<h1 class="main-header">🎬 VietDub</h1>', unsafe_allow_html=True)
+    Args:
+        current_step: Bước hiện tại (1-3)
     
-    # Step indicator
+    Returns:
+        Chuỗi HTML, chỉ phụ thuộc vào current_step nên được cache theo nó
+    """
     steps = ["Input", "Edit", "Export"]
-    
-    # Generate HTML for step indicator
-    html_steps = '<div class="step-indicator-container">'
+    parts = ['<div class="step-indicator-container">']
     
     for i, step in enumerate(steps, 1):
         # Determine status
-        if i < st.session_state.current_step:
+        if i < current_step:
             status_class = "completed"
             icon = "✓"
-        elif i == st.session_state.current_step:
+        elif i == current_step:
             status_class = "active"
             icon = str(i)
         else:
@@ -873,19 +1102,33 @@ def main():
             
         # Add connection line (except for first item)
         if i > 1:
-            line_class = "active" if i <= st.session_state.current_step else ""
-            html_steps += f'<div class="step-line {line_class}"></div>'
+            line_class = "active" if i <= current_step else ""
+            parts.append(f'<div class="step-line {line_class}"></div>')
             
         # Add step item
-        html_steps += f"""
+        parts.append(f"""
         <div class="step-item {status_class}">
             <div class="step-circle">{icon}</div>
             <div class="step-label">{step}</div>
         </div>
-        """
+        """)
         
-    html_steps += '</div>'
-    st.markdown(html_steps, unsafe_allow_html=True)
+    parts.append('</div>')
+    return "".join(parts)
+
+
+def main():
+    """Main application"""
+    inject_css()
+    
+    # Render sidebar
+    render_sidebar()
+    
+    # Header
+    st.markdown('<h1 class="main-header">🎬 VietDub</h1>', unsafe_allow_html=True)
+    
+    # Step indicator
+    st.markdown(step_indicator_html(st.session_state.current_step), unsafe_allow_html=True)
     
     st.markdown("<br>", unsafe_allow_html=True)
     
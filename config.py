@@ -11,6 +11,24 @@ WHISPER_MODELS = {
     "large-v3": "Large V3 (Tốt nhất, cần GPU mạnh)"
 }
 
+# Whisper Compute Types (CTranslate2 quantization)
+COMPUTE_TYPES = {
+    "auto": "Auto (int8 trên CPU, int8_float16 trên GPU)",
+    "int8": "int8 (Nhanh, ít RAM - CPU)",
+    "int8_float16": "int8_float16 (Nhanh, ít VRAM - GPU)",
+    "float16": "float16 (GPU)",
+    "float32": "float32 (Chính xác nhất, chậm nhất)"
+}
+
+# H.264 Encoders cho export video
+VIDEO_ENCODERS = {
+    "auto": "Auto (GPU nếu có, không thì libx264)",
+    "libx264": "libx264 (CPU, chất lượng ổn định nhất)",
+    "h264_nvenc": "NVENC (GPU NVIDIA)",
+    "h264_videotoolbox": "VideoToolbox (macOS)",
+    "h264_qsv": "Quick Sync (GPU Intel)"
+}
+
 # Translation Models via OpenRouter
 TRANSLATION_MODELS = {
     # Free Models
@@ -64,12 +82,18 @@ OPENAI_VOICES = {
 # Default Values
 DEFAULTS = {
     "whisper_model": "tiny",
+    "compute_type": "auto",
     "translation_model": "meta-llama/llama-3.3-70b-instruct:free",
+    "translation_batch_size": 20,
+    "translation_workers": 4,
     "tts_provider": "fpt",
     "voice": "banmai",
     "speed": 1.0,
     "original_volume": 0.1,
-    "dubbing_volume": 1.0
+    "dubbing_volume": 1.0,
+    "tts_workers": 8,
+    "whisper_batch_size": 16,
+    "video_encoder": "auto"
 }
 
 # Translation Prompt Template
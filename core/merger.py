@@ -6,114 +6,121 @@ Sử dụng FFmpeg để ghép audio dubbed vào video gốc
 import subprocess
 import os
 import tempfile
+import functools
 from typing import List, Dict, Optional
-from pydub import AudioSegment
+from utils.file_utils import get_video_info
 
 
-def create_dubbed_audio(
-    segments: List[Dict],
-    total_duration: float,
-    original_audio_path: Optional[str] = None,
-    original_volume: float = 0.1,
-    dubbed_volume: float = 1.0
-) -> str:
+# Tham số chất lượng cho từng H.264 encoder (tương đương libx264 crf 23)
+VIDEO_ENCODER_ARGS = {
+    "h264_nvenc": ["-preset", "p4", "-rc", "vbr", "-cq", "23", "-b:v", "0"],
+    "h264_videotoolbox": ["-b:v", "6M", "-allow_sw", "1"],
+    "h264_qsv": ["-preset", "veryfast", "-global_quality", "23"],
+    "libx264": ["-preset", "veryfast", "-crf", "23"]
+}
+
+# Thứ tự ưu tiên khi tự dò hardware encoder
+HW_ENCODERS = ("h264_nvenc", "h264_videotoolbox", "h264_qsv")
+
+# Chuẩn hóa format để amix không phải tự negotiate giữa các input khác nhau
+AUDIO_FORMAT = "aformat=sample_rates=44100:channel_layouts=stereo"
+
+
+def _voice_segments(segments: List[Dict]) -> List[Dict]:
+    """Các segment đã có file audio dubbed"""
+    return [
+        seg for seg in segments
+        if seg.get("audio_path") and os.path.exists(seg["audio_path"])
+    ]
+
+
+def _build_mix_filters(
+    bg_stream: str,
+    voice_segments: List[Dict],
+    first_voice_input: int,
+    original_volume: float,
+    dubbed_volume: float,
+    use_original: bool,
+    output_label: str
+) -> List[str]:
     """
-    Ghép các audio segments thành một file audio hoàn chỉnh với Auto-Ducking
+    Tạo các filter ghép tiếng nền + giọng dubbed
+    
+    Args:
+        bg_stream: Stream nền, ví dụ "0:a" (tiếng gốc hoặc anullsrc)
+        voice_segments: Segments có audio, input thứ first_voice_input trở đi
+        first_voice_input: Index input FFmpeg của segment đầu tiên
+        use_original: True nếu bg_stream là tiếng gốc (cần chỉnh volume)
+        output_label: Label của audio đã mix, ví dụ "aout"
+    
+    Returns:
+        List filter (nối bằng ";")
     """
-    total_ms = int(total_duration * 1000)
+    filters = []
     
     # 1. Base Audio Layer
-    if original_audio_path and os.path.exists(original_audio_path):
-        try:
-            base_audio = AudioSegment.from_file(original_audio_path)
-            # Resize base audio
-            if len(base_audio) > total_ms:
-                base_audio = base_audio[:total_ms]
-            elif len(base_audio) < total_ms:
-                base_audio = base_audio + AudioSegment.silent(duration=total_ms - len(base_audio))
-        except Exception as e:
-            print(f"Error loading original audio: {e}")
-            base_audio = AudioSegment.silent(duration=total_ms)
+    if use_original:
+        # Volume nền: giảm dB theo volume setting, apad để nền luôn đủ dài
+        base_db_adj = -20 * (1.0 - original_volume)
+        filters.append(f"[{bg_stream}]{AUDIO_FORMAT},volume={base_db_adj:.2f}dB,apad[bg]")
     else:
-        base_audio = AudioSegment.silent(duration=total_ms)
+        # Không dùng tiếng gốc: nền im lặng
+        filters.append(f"[{bg_stream}]{AUDIO_FORMAT}[bg]")
     
     # 2. Voice Layer (Dubbed)
-    voice_layer = AudioSegment.silent(duration=total_ms)
-    
-    # Track where we have voice to apply ducking
-    voice_segments_mask = []  # List of tuples (start_ms, end_ms)
+    dubbed_db_adj = 20 * (dubbed_volume - 1)
+    mix_inputs = ["[bg]"]
+    for i, seg in enumerate(voice_segments, start=first_voice_input):
+        delay_ms = int(seg["start"] * 1000)
+        filters.append(
+            f"[{i}:a]{AUDIO_FORMAT},adelay=delays={delay_ms}:all=1,"
+            f"volume={dubbed_db_adj:.2f}dB[a{i}]"
+        )
+        mix_inputs.append(f"[a{i}]")
     
-    for seg in segments:
-        if not seg.get("audio_path") or not os.path.exists(seg["audio_path"]):
-            continue
-        
-        try:
-            audio = AudioSegment.from_file(seg["audio_path"])
-            
-            # Apply dubbed volume
-            if dubbed_volume != 1.0:
-                audio = audio + (20 * (dubbed_volume - 1))
-            
-            start_ms = int(seg["start"] * 1000)
-            voice_layer = voice_layer.overlay(audio, position=start_ms)
-            
-            # Record voice timing for ducking
-            voice_segments_mask.append((start_ms, start_ms + len(audio)))
-            
-        except Exception as e:
-            print(f"Error overlaying segment {seg['id']}: {e}")
-    
-    # 3. Apply Auto-Ducking to Base Audio
-    # Nếu có original volume, chúng ta sẽ giữ nền ở mức đó
-    # Nhưng khi CÓ giọng đọc, chúng ta giảm nó xuống thêm (ducking)
-    # Ví dụ: Nền bình thường 30%, khi có người nói giảm còn 10%
-    
-    final_audio = base_audio
-    
-    # Simple Ducking: Reduce volume during voice segments
-    if original_volume > 0:
-        # Volume nền mặc định (ví dụ 0.3)
-        base_db_adj = -20 * (1.0 - original_volume) # Giảm dB theo volume setting
-        
-        # Volume khi có giọng đọc (ducking) - giảm thêm 10dB
-        duck_db_adj = base_db_adj - 10 
-        
-        # Áp dụng volume mặc định cho toàn bài trước
-        final_audio = final_audio + base_db_adj
-        
-        # TODO: Advanced ducking cần pydub complex logic (split & gain).
-        # Để đơn giản và hiệu quả: Chúng ta mix Voice đè lên Base đã giảm volume.
-        # Với version đơn giản này, ta chấp nhận volume nền background thấp đều.
-        pass
-    else:
-        final_audio = final_audio - 100 # Silence
-        
-    # 4. Final Mix
-    output_audio = final_audio.overlay(voice_layer)
+    # 3. Final Mix (normalize=0 để cộng các layer như overlay, không chia đều volume)
+    filters.append(
+        f"{''.join(mix_inputs)}amix=inputs={len(mix_inputs)}:duration=first:normalize=0[{output_label}]"
+    )
+    return filters
+
+
+def _run_filter_script(cmd: List[str], filters: List[str], output_args: List[str], timeout: int):
+    """
+    Chạy FFmpeg với filtergraph ghi ra file script
     
-    output_path = tempfile.mktemp(suffix=".mp3")
-    output_audio.export(output_path, format="mp3")
+    Filtergraph có thể rất dài với video nhiều segment, vượt giới hạn độ dài
+    command line nếu truyền qua -filter_complex.
+    """
+    filter_script = tempfile.mktemp(suffix=".txt")
+    with open(filter_script, 'w', encoding='utf-8') as f:
+        f.write(";\n".join(filters))
     
-    return output_path
+    try:
+        return subprocess.run(
+            cmd + ["-filter_complex_script", filter_script] + output_args,
+            capture_output=True,
+            text=True,
+            timeout=timeout
+        )
+    finally:
+        if os.path.exists(filter_script):
+            os.remove(filter_script)
 
 
-def create_srt_file(segments: List[Dict], output_path: Optional[str] = None, max_line_width: int = 50) -> str:
+def create_srt_text(segments: List[Dict], max_line_width: int = 50) -> str:
     """
-    Tạo file SRT từ segments với xử lý xuống dòng
+    Tạo nội dung SRT từ segments với xử lý xuống dòng
     
     Args:
         segments: List segments
-        output_path: Đường dẫn output
         max_line_width: Số ký tự tối đa trên 1 dòng
     
     Returns:
-        Đường dẫn file SRT
+        Nội dung SRT
     """
     import textwrap
     
-    if output_path is None:
-        output_path = tempfile.mktemp(suffix=".srt")
-    
     def format_srt_time(seconds: float) -> str:
         """Convert seconds to SRT format (HH:MM:SS,mmm)"""
         hours = int(seconds // 3600)
@@ -122,92 +129,52 @@ def create_srt_file(segments: List[Dict], output_path: Optional[str] = None, max
         millis = int((seconds % 1) * 1000)
         return f"{hours:02d}:{minutes:02d}:{secs:02d},{millis:03d}"
     
-    with open(output_path, 'w', encoding='utf-8') as f:
-        for i, seg in enumerate(segments):
-            text = seg.get("vietnamese") or seg.get("text", "")
-            
-            # Wrap text to ensure max 2 lines (mostly)
-            wrapped_lines = textwrap.wrap(text, width=max_line_width)
-            wrapped_text = "\n".join(wrapped_lines)
-            
-            f.write(f"{i + 1}\n")
-            f.write(f"{format_srt_time(seg['start'])} --> {format_srt_time(seg['end'])}\n")
-            f.write(f"{wrapped_text}\n\n")
+    parts = []
+    for i, seg in enumerate(segments):
+        text = seg.get("vietnamese") or seg.get("text", "")
+        
+        # Wrap text to ensure max 2 lines (mostly)
+        wrapped_lines = textwrap.wrap(text, width=max_line_width)
+        wrapped_text = "\n".join(wrapped_lines)
+        
+        parts.append(
+            f"{i + 1}\n"
+            f"{format_srt_time(seg['start'])} --> {format_srt_time(seg['end'])}\n"
+            f"{wrapped_text}\n\n"
+        )
     
-    return output_path
+    return "".join(parts)
 
 
-def merge_video_audio(
-    video_path: str,
-    audio_path: str,
-    output_path: str,
-    subtitle_path: Optional[str] = None,
-    burn_subtitles: bool = True,
-    font_size: int = 24
-) -> bool:
+def create_srt_file(segments: List[Dict], output_path: Optional[str] = None, max_line_width: int = 50) -> str:
     """
-    Ghép video với audio mới và (optional) hardsub
+    Tạo file SRT từ segments với xử lý xuống dòng
+    
+    Args:
+        segments: List segments
+        output_path: Đường dẫn output
+        max_line_width: Số ký tự tối đa trên 1 dòng
+    
+    Returns:
+        Đường dẫn file SRT
     """
-    try:
-        # Build FFmpeg command
-        cmd = ["ffmpeg", "-y"]
-        
-        # Input files
-        cmd.extend(["-i", video_path])
-        cmd.extend(["-i", audio_path])
-        
-        if burn_subtitles and subtitle_path and os.path.exists(subtitle_path):
-            # Complex filter để burn subtitles
-            # Escape special characters trong path
-            escaped_sub_path = subtitle_path.replace("\\", "\\\\").replace(":", "\\:")
-            
-            # Adjust style based on font size
-            style = f"FontSize={font_size},PrimaryColour=&HFFFFFF,OutlineColour=&H000000,Outline=2,Alignment=2,MarginV=20"
-            
-            cmd.extend([
-                "-filter_complex",
-                f"[0:v]subtitles='{escaped_sub_path}':force_style='{style}'[v]",
-                "-map", "[v]",
-                "-map", "1:a"
-            ])
-        else:
-            # Simple merge
-            cmd.extend([
-                "-map", "0:v",
-                "-map", "1:a"
-            ])
-        
-        # Output settings
-        cmd.extend([
-            "-c:v", "libx264",
-            "-preset", "medium",
-            "-crf", "23",
-            "-c:a", "aac",
-            "-b:a", "192k",
-            "-shortest",
-            output_path
-        ])
-        
-        # Run FFmpeg
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            timeout=600  # 10 minutes timeout
-        )
-        
-        if result.returncode != 0:
-            print(f"FFmpeg error: {result.stderr}")
-            return False
-        
-        return True
-        
-    except subprocess.TimeoutExpired:
-        print("FFmpeg timeout")
-        return False
-    except Exception as e:
-        print(f"Merge error: {e}")
-        return False
+    if output_path is None:
+        output_path = tempfile.mktemp(suffix=".srt")
+    
+    with open(output_path, 'w', encoding='utf-8') as f:
+        f.write(create_srt_text(segments, max_line_width))
+    
+    return output_path
+
+
+def _subtitle_filter(subtitle_path: str, font_size: int) -> str:
+    """Filter burn subtitles (escape các ký tự đặc biệt trong path)"""
+    escaped_sub_path = subtitle_path.replace("\\", "\\\\").replace(":", "\\:")
+    
+    # Adjust style based on font size
+    style = f"FontSize={font_size},PrimaryColour=&HFFFFFF,OutlineColour=&H000000,Outline=2,Alignment=2,MarginV=20"
+    
+    return f"subtitles='{escaped_sub_path}':force_style='{style}'"
 
 
 def export_video(
@@ -221,49 +188,38 @@ def export_video(
     progress_callback=None,
     preview_duration: Optional[float] = None,
     font_size: int = 24,
-    max_line_width: int = 50
+    max_line_width: int = 50,
+    video_encoder: Optional[str] = None
 ) -> bool:
     """
     Pipeline hoàn chỉnh để export video dubbed
-    """
-    from moviepy.editor import VideoFileClip
     
-    if progress_callback:
-        progress_callback("Đang tạo audio dubbed...")
+    Mix audio, burn subtitles và encode video trong một lệnh FFmpeg duy nhất:
+    tiếng gốc lấy trực tiếp từ video, các segment được adelay + amix, video
+    đi qua filter subtitles trong cùng filtergraph nên chỉ decode/encode một lần.
     
-    # Get total duration and extract original audio
-    video = VideoFileClip(video_path)
-    total_duration = video.duration
+    Args:
+        original_audio_path: File tiếng gốc riêng (mặc định lấy audio của video)
+        preview_duration: Chỉ render N giây đầu (Quick Preview)
+        video_encoder: H.264 encoder ("auto"/None = hardware encoder nếu có)
     
-    # Extract original audio for mixing context
-    temp_original_audio = None
-    if original_volume > 0 and video.audio:
-        temp_original_audio = tempfile.mktemp(suffix=".mp3")
-        try:
-            video.audio.write_audiofile(temp_original_audio, verbose=False, logger=None)
-        except Exception as e:
-            print(f"Error extracting audio: {e}")
-            temp_original_audio = None
-
-    # Nếu là preview, giới hạn duration
+    Returns:
+        True nếu export thành công
+    """
+    # Get total duration and check original audio (ffprobe, cache theo file)
+    info = get_video_info(video_path)
+    if not info:
+        print(f"Export error: cannot probe {video_path}")
+        return False
+    total_duration = info["duration"]
+    has_audio = info["has_audio"]
+    
+    # Nếu là preview, giới hạn duration và segments
     if preview_duration and preview_duration < total_duration:
         total_duration = preview_duration
-    
-    video.close()
-    
-    # Filter segments nếu là preview
     if preview_duration:
         segments = [seg for seg in segments if seg["start"] < preview_duration]
     
-    # Create dubbed audio
-    dubbed_audio = create_dubbed_audio(
-        segments,
-        total_duration,
-        temp_original_audio, # Pass extracted audio path
-        original_volume,
-        dubbed_volume
-    )
-    
     if progress_callback:
         progress_callback("Đang tạo file subtitles...")
     
@@ -275,46 +231,90 @@ def export_video(
     if progress_callback:
         progress_callback("Đang render video...")
     
-    # Nếu là preview, cắt video trước khi merge
-    temp_video_path = video_path
+    # Input 0: video (input -t để preview chỉ đọc N giây đầu)
+    cmd = ["ffmpeg", "-y"]
     if preview_duration:
-        temp_video_path = tempfile.mktemp(suffix=".mp4")
-        cut_cmd = [
-            "ffmpeg", "-y",
-            "-i", video_path,
-            "-t", str(preview_duration),
-            "-c", "copy",
-            temp_video_path
-        ]
-        subprocess.run(cut_cmd, capture_output=True, timeout=120)
-    
-    # Merge
-    success = merge_video_audio(
-        temp_video_path,
-        dubbed_audio,
-        output_path,
-        srt_path,
-        burn_subtitles,
-        font_size=font_size
+        cmd.extend(["-t", str(preview_duration)])
+    cmd.extend(["-i", video_path])
+    
+    # Nền: file tiếng gốc riêng, audio của video, hoặc im lặng
+    use_original = original_volume > 0
+    if use_original and original_audio_path and os.path.exists(original_audio_path):
+        cmd.extend(["-i", original_audio_path])
+        bg_stream = "1:a"
+    elif use_original and has_audio:
+        bg_stream = "0:a"
+    else:
+        use_original = False
+        cmd.extend(["-f", "lavfi", "-i", "anullsrc=r=44100:cl=stereo"])
+        bg_stream = "1:a"
+    
+    first_voice_input = 1 if bg_stream == "0:a" else 2
+    voice_segments = _voice_segments(segments)
+    for seg in voice_segments:
+        cmd.extend(["-i", seg["audio_path"]])
+    
+    filters = _build_mix_filters(
+        bg_stream, voice_segments, first_voice_input,
+        original_volume, dubbed_volume, use_original, "aout"
     )
     
-    # Cleanup temp files
-    cleanup_files = [dubbed_audio, srt_path]
-    if preview_duration and temp_video_path != video_path:
-        cleanup_files.append(temp_video_path)
+    if srt_path:
+        filters.append(f"[0:v]{_subtitle_filter(srt_path, font_size)}[vout]")
+        video_map = "[vout]"
+    else:
+        video_map = "0:v"
+    
+    if not video_encoder or video_encoder == "auto":
+        video_encoder = detect_hw_encoder()
     
-    for path in cleanup_files:
-        if path and os.path.exists(path):
+    def output_args(encoder: str) -> List[str]:
+        """Output settings cho encoder"""
+        args = [
+            "-map", video_map,
+            "-map", "[aout]",
+            "-t", f"{total_duration:.3f}",
+            "-c:v", encoder,
+            *VIDEO_ENCODER_ARGS.get(encoder, []),
+            "-pix_fmt", "yuv420p",
+            "-c:a", "aac",
+            "-b:a", "192k"
+        ]
+        if output_path.lower().endswith(".mp4"):
+            # moov atom ở đầu file để video phát được ngay khi đang tải
+            args.extend(["-movflags", "+faststart"])
+        args.append(output_path)
+        return args
+    
+    try:
+        result = _run_filter_script(cmd, filters, output_args(video_encoder), timeout=1200)
+        if result.returncode != 0 and video_encoder != "libx264":
+            # Hardware encoder lỗi giữa chừng (hết VRAM, driver...) -> encode lại bằng CPU
+            print(f"FFmpeg error with {video_encoder}, retrying with libx264: {result.stderr[-500:]}")
+            result = _run_filter_script(cmd, filters, output_args("libx264"), timeout=1200)
+        if result.returncode != 0:
+            print(f"FFmpeg error: {result.stderr}")
+            return False
+        return True
+        
+    except subprocess.TimeoutExpired:
+        print("FFmpeg timeout")
+        return False
+    except Exception as e:
+        print(f"Export error: {e}")
+        return False
+    finally:
+        # Cleanup temp files
+        if srt_path and os.path.exists(srt_path):
             try:
-                os.remove(path)
+                os.remove(srt_path)
             except:
                 pass
-    
-    return success
 
 
+@functools.lru_cache(maxsize=1)
 def check_ffmpeg_installed() -> bool:
-    """Kiểm tra FFmpeg đã được cài chưa"""
+    """Kiểm tra FFmpeg đã được cài chưa (chỉ chạy một lần mỗi process)"""
     try:
         result = subprocess.run(
             ["ffmpeg", "-version"],
@@ -324,3 +324,47 @@ def check_ffmpeg_installed() -> bool:
         return result.returncode == 0
     except:
         return False
+
+
+@functools.lru_cache(maxsize=1)
+def detect_hw_encoder() -> str:
+    """
+    Dò H.264 hardware encoder dùng được (chỉ chạy một lần mỗi process)
+    
+    Encoder có trong `ffmpeg -encoders` chưa chắc dùng được (build có NVENC
+    nhưng máy không có GPU NVIDIA), nên thử encode một clip ngắn để xác nhận.
+    
+    Returns:
+        Tên encoder: h264_nvenc, h264_videotoolbox, h264_qsv hoặc libx264
+    """
+    try:
+        result = subprocess.run(
+            ["ffmpeg", "-hide_banner", "-encoders"],
+            capture_output=True,
+            text=True,
+            timeout=10
+        )
+        available = result.stdout
+    except:
+        return "libx264"
+    
+    for encoder in HW_ENCODERS:
+        if encoder not in available:
+            continue
+        try:
+            probe = subprocess.run(
+                [
+                    "ffmpeg", "-hide_banner", "-f", "lavfi",
+                    "-i", "color=c=black:s=256x256:d=0.2",
+                    "-c:v", encoder, "-pix_fmt", "yuv420p",
+                    "-f", "null", "-"
+                ],
+                capture_output=True,
+                timeout=15
+            )
+            if probe.returncode == 0:
+                return encoder
+        except:
+            continue
+    
+    return "libx264"
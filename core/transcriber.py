@@ -1,105 +1,237 @@
 """
 VietDub Solo - Transcriber Module
-Sử dụng OpenAI Whisper để transcribe audio thành text với timestamps
+Sử dụng faster-whisper (CTranslate2) để transcribe audio thành text với timestamps
 """
 
-import whisper
-import torch
+import ctranslate2
+from faster_whisper import WhisperModel, BatchedInferencePipeline
 import os
-from typing import List, Dict, Optional
-import tempfile
-from moviepy.editor import VideoFileClip
+import gc
+import functools
+import subprocess
+from typing import List, Dict, Optional, Union
+import numpy as np
 
 
 def get_available_device() -> str:
-    """Kiểm tra GPU availability"""
-    if torch.cuda.is_available():
+    """Kiểm tra GPU availability (CTranslate2 hỗ trợ CUDA hoặc CPU)"""
+    if ctranslate2.get_cuda_device_count() > 0:
         return "cuda"
-    elif hasattr(torch.backends, 'mps') and torch.backends.mps.is_available():
-        return "mps"  # Apple Silicon
     return "cpu"
 
 
-def extract_audio(video_path: str, output_path: Optional[str] = None) -> str:
+def get_default_compute_type(device: str) -> str:
+    """Precision mặc định: int8 weights trên CPU, int8 + fp16 activations trên GPU"""
+    return "int8_float16" if device == "cuda" else "int8"
+
+
+def _cgroup_cpu_limit() -> Optional[int]:
+    """Số CPU theo quota cgroup (container), None nếu không giới hạn"""
+    try:
+        # cgroup v2: "<quota> <period>" hoặc "max <period>"
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()[:2]
+        if quota != "max":
+            return max(1, -(-int(quota) // int(period)))
+        return None
+    except (OSError, ValueError):
+        pass
+    try:
+        # cgroup v1
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f:
+            quota = int(f.read())
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f:
+            period = int(f.read())
+        if quota > 0 and period > 0:
+            return max(1, -(-quota // period))
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def get_cpu_thread_count() -> int:
+    """
+    Số thread CPU cho CTranslate2
+    
+    os.cpu_count() trả về số core của cả máy, bỏ qua CPU affinity và quota
+    của container -> dùng số core process thực sự được chạy, giới hạn theo quota.
+    """
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        # sched_getaffinity không có trên macOS/Windows
+        cpus = os.cpu_count() or 4
+    
+    quota = _cgroup_cpu_limit()
+    if quota is not None:
+        cpus = min(cpus, quota)
+    return max(1, cpus)
+
+
+def load_whisper_model(
+    model_name: str = "base",
+    device: Optional[str] = None,
+    compute_type: Optional[str] = None
+) -> WhisperModel:
+    """
+    Load Whisper model lên device
+    
+    Args:
+        model_name: Tên model Whisper (tiny, base, small, medium, large-v3)
+        device: cuda/cpu (mặc định tự detect)
+        compute_type: int8, int8_float16, float16, float32 hoặc "auto"/None
+    
+    Returns:
+        faster-whisper WhisperModel
+    """
+    if device is None:
+        device = get_available_device()
+    if compute_type in (None, "auto"):
+        compute_type = get_default_compute_type(device)
+    
+    return _get_whisper_model(model_name, device, compute_type)
+
+
+@functools.lru_cache(maxsize=2)
+def _get_whisper_model(model_name: str, device: str, compute_type: str) -> WhisperModel:
+    """
+    Load model một lần cho mỗi (model, device, compute_type), giữ lại trong RAM/VRAM
+    
+    maxsize=2: đổi qua lại giữa 2 model không phải load lại, model cũ hơn bị bỏ.
+    """
+    # CTranslate2 mặc định chỉ dùng 4 thread trên CPU -> dùng hết các core được cấp
+    cpu_threads = get_cpu_thread_count() if device == "cpu" else 0
+    
+    # faster-whisper tải model đã convert sẵn sang CTranslate2 và quantize khi load,
+    # nên không cần chạy ct2-transformers-converter thủ công
+    return WhisperModel(
+        model_name,
+        device=device,
+        compute_type=compute_type,
+        cpu_threads=cpu_threads
+    )
+
+
+def unload_whisper_model():
+    """Bỏ các model đã cache để giải phóng RAM/VRAM (CTranslate2 free khi model bị thu hồi)"""
+    _get_whisper_model.cache_clear()
+    gc.collect()
+
+
+def load_audio(video_path: str, sample_rate: int = 16000) -> np.ndarray:
     """
-    Trích xuất audio từ video file
+    Decode audio của video thành waveform trong RAM
+    
+    FFmpeg ghi PCM s16le 16kHz mono ra stdout, không tạo file tạm. Whisper nhận
+    thẳng ndarray nên không phải decode lại file audio lần thứ hai.
     
     Args:
-        video_path: Đường dẫn đến video
-        output_path: Đường dẫn output (optional)
+        video_path: Đường dẫn video (hoặc audio)
+        sample_rate: Sample rate output (Whisper dùng 16kHz)
     
     Returns:
-        Đường dẫn file audio
+        Waveform float32 mono trong khoảng [-1, 1]
     """
-    if output_path is None:
-        output_path = tempfile.mktemp(suffix=".mp3")
+    result = subprocess.run(
+        [
+            "ffmpeg", "-nostdin",
+            "-i", video_path,
+            "-vn",
+            "-f", "s16le",
+            "-acodec", "pcm_s16le",
+            "-ac", "1",
+            "-ar", str(sample_rate),
+            "-"
+        ],
+        capture_output=True
+    )
     
-    video = VideoFileClip(video_path)
-    video.audio.write_audiofile(output_path, verbose=False, logger=None)
-    video.close()
+    if result.returncode != 0:
+        stderr = result.stderr.decode("utf-8", errors="replace")
+        raise RuntimeError(f"FFmpeg audio decode error: {stderr[-1000:]}")
     
-    return output_path
+    return np.frombuffer(result.stdout, np.int16).astype(np.float32) / 32768.0
 
 
 def transcribe_audio(
-    audio_path: str,
+    audio_path: Union[str, np.ndarray],
     model_name: str = "base",
-    language: str = "en"
+    language: str = "en",
+    model: Optional[WhisperModel] = None,
+    batch_size: int = 16,
+    compute_type: Optional[str] = None
 ) -> List[Dict]:
     """
     Transcribe audio thành text với timestamps
     
     Args:
-        audio_path: Đường dẫn file audio
+        audio_path: Đường dẫn file audio hoặc waveform 16kHz mono (load_audio)
         model_name: Tên model Whisper (tiny, base, small, medium, large-v3)
         language: Ngôn ngữ của audio
+        model: Model đã load sẵn (optional, tránh load lại weights)
+        batch_size: Số đoạn audio (chia theo VAD) decode cùng lúc
+        compute_type: Precision khi phải tự load model
     
     Returns:
         List các segments với format:
         [{"id": 1, "start": 0.0, "end": 5.0, "text": "Hello world"}, ...]
     """
-    device = get_available_device()
+    # Load model nếu chưa được truyền vào (lấy từ cache nếu đã load)
+    if model is None:
+        model = load_whisper_model(model_name, compute_type=compute_type)
     
-    # Load model
-    model = whisper.load_model(model_name, device=device)
-    
-    # Transcribe
-    result = model.transcribe(
-        audio_path,
-        language=language,
-        word_timestamps=False,
-        verbose=False
-    )
+    if batch_size > 1:
+        # Transcribe theo batch: VAD chia audio thành các chunk rồi decode song song trên GPU/CPU
+        pipeline = BatchedInferencePipeline(model=model)
+        result, _info = pipeline.transcribe(
+            audio_path,
+            language=language,
+            batch_size=batch_size,
+            word_timestamps=False
+        )
+    else:
+        # Decode tuần tự (ít RAM/VRAM nhất), vẫn dùng Silero VAD để bỏ qua đoạn im lặng
+        result, _info = model.transcribe(
+            audio_path,
+            language=language,
+            vad_filter=True,
+            word_timestamps=False
+        )
     
-    # Format segments
-    segments = []
-    for i, seg in enumerate(result["segments"]):
-        segments.append({
-            "id": i + 1,
-            "start": round(seg["start"], 2),
-            "end": round(seg["end"], 2),
-            "text": seg["text"].strip(),
+    # Format segments (result là generator, decode diễn ra khi iterate)
+    return [
+        {
+            "id": i,
+            "start": round(seg.start, 2),
+            "end": round(seg.end, 2),
+            "text": seg.text.strip(),
             "vietnamese": "",  # Sẽ điền sau khi dịch
             "audio_path": ""   # Sẽ điền sau khi TTS
-        })
-    
-    return segments
+        }
+        for i, seg in enumerate(result, start=1)
+    ]
 
 
 def transcribe_video(
     video_path: str,
     model_name: str = "base",
     language: str = "en",
-    progress_callback=None
+    progress_callback=None,
+    model: Optional[WhisperModel] = None,
+    batch_size: int = 16,
+    compute_type: Optional[str] = None
 ) -> List[Dict]:
     """
-    Pipeline hoàn chỉnh: Video -> Audio -> Transcription
+    Pipeline hoàn chỉnh: Video -> Audio (waveform trong RAM) -> Transcription
     
     Args:
         video_path: Đường dẫn video
         model_name: Model Whisper
         language: Ngôn ngữ
         progress_callback: Callback để update progress
+        model: Model Whisper đã load sẵn (optional)
+        batch_size: Batch size cho BatchedInferencePipeline
+        compute_type: Precision của model (int8, int8_float16, ...)
     
     Returns:
         List segments
@@ -107,18 +239,17 @@ def transcribe_video(
     if progress_callback:
         progress_callback("Đang trích xuất audio từ video...")
     
-    # Extract audio
-    audio_path = extract_audio(video_path)
+    # Decode audio một lần, truyền waveform cho Whisper (không qua file tạm)
+    audio = load_audio(video_path)
     
     if progress_callback:
         progress_callback(f"Đang transcribe với model {model_name}...")
     
     # Transcribe
-    segments = transcribe_audio(audio_path, model_name, language)
-    
-    # Cleanup temp file
-    if os.path.exists(audio_path):
-        os.remove(audio_path)
+    segments = transcribe_audio(
+        audio, model_name, language,
+        model=model, batch_size=batch_size, compute_type=compute_type
+    )
     
     if progress_callback:
         progress_callback(f"Hoàn tất! Tìm thấy {len(segments)} đoạn.")
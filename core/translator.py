@@ -5,18 +5,60 @@ Sử dụng OpenRouter API để dịch text sang tiếng Việt
 
 import requests
 import json
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Optional
 from config import TRANSLATION_PROMPT
+from utils.http_utils import RateLimiter, create_session
+from utils.translation_cache import get_cached_translation, set_cached_translation
+
+# orjson (C) parse/serialize nhanh hơn json của stdlib nhiều lần; không có thì fallback
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 
 OPENROUTER_API_URL = "https://openrouter.ai/api/v1/chat/completions"
 
+# Session mặc định cho cả module: giữ kết nối keep-alive tới OpenRouter giữa các batch
+_SESSION = create_session()
+
+# Model free của OpenRouter bị giới hạn ~20 request/phút
+FREE_MODEL_RPM = 20
+
+# Decoder dùng chung cho parse_translation_response (raw_decode)
+_DECODER = json.JSONDecoder()
+
+# Tách template quanh {segments} một lần; mỗi batch chỉ cần nối chuỗi thay vì .format()
+# (bỏ escape {{ }} của template để kết quả giống hệt .format())
+_PROMPT_PREFIX, _PROMPT_SUFFIX = (
+    part.replace("{{", "{").replace("}}", "}")
+    for part in TRANSLATION_PROMPT.split("{segments}", 1)
+)
+
+
+def _json_dumps(obj) -> str:
+    """Serialize JSON (giữ nguyên Unicode, indent 2 như prompt gốc)"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2).decode("utf-8")
+    return json.dumps(obj, ensure_ascii=False, indent=2)
+
+
+def _json_loads(text: str):
+    """Parse JSON (orjson.JSONDecodeError là subclass của json.JSONDecodeError)"""
+    if orjson is not None:
+        return orjson.loads(text)
+    return json.loads(text)
+
 
 def translate_segments(
     segments: List[Dict],
     api_key: str,
     model: str = "google/gemini-2.5-flash-lite",
-    batch_size: int = 20
+    batch_size: int = 20,
+    max_workers: int = 4,
+    session: Optional[requests.Session] = None,
+    requests_per_minute: Optional[float] = None
 ) -> List[Dict]:
     """
     Dịch các segments sang tiếng Việt
@@ -26,6 +68,10 @@ def translate_segments(
         api_key: OpenRouter API key
         model: Model để dịch
         batch_size: Số câu dịch mỗi batch
+        max_workers: Số batch gửi song song
+        session: requests.Session dùng lại giữa các lần gọi (optional)
+        requests_per_minute: Giới hạn request/phút (mặc định 20 với model ":free",
+            không giới hạn với model trả phí)
     
     Returns:
         Segments với trường 'vietnamese' đã được điền
@@ -36,68 +82,110 @@ def translate_segments(
     # Chia thành batches
     batches = [segments[i:i + batch_size] for i in range(0, len(segments), batch_size)]
     
-    for batch in batches:
-        try:
-            # Chuẩn bị text để dịch
-            text_to_translate = json.dumps([
-                {"id": seg["id"], "english": seg["text"]}
-                for seg in batch
-            ], ensure_ascii=False, indent=2)
-            
-            prompt = TRANSLATION_PROMPT.format(segments=text_to_translate)
-            
-            # Gọi API
-            response = call_openrouter(api_key, model, prompt)
-            
-            if response:
-                # Parse response và cập nhật segments
-                try:
-                    translations = parse_translation_response(response)
-                    
-                    if not translations:
-                        # Nếu parse không được gì, fallback
-                        raise ValueError("Không thể parse response từ AI")
-                    
-                    for seg in batch:
-                        seg_id = seg["id"]
-                        # Thử nhiều cách match id
-                        if seg_id in translations:
-                            seg["vietnamese"] = translations[seg_id]
-                        elif str(seg_id) in translations:
-                            seg["vietnamese"] = translations[str(seg_id)]
-                        else:
-                            # Fallback nếu không tìm thấy
-                            if not seg.get("vietnamese"):
-                                seg["vietnamese"] = seg["text"]
-                                
-                except Exception as parse_error:
-                    print(f"Error parsing translation: {parse_error}")
-                    print(f"Raw response: {response[:500] if response else 'None'}")
-                    # Fallback: giữ nguyên text gốc
-                    for seg in batch:
-                        if not seg.get("vietnamese"):
-                            seg["vietnamese"] = seg["text"]
-            else:
-                # Nếu API không trả về gì, fallback
+    if requests_per_minute is None and model.endswith(":free"):
+        requests_per_minute = FREE_MODEL_RPM
+    limiter = RateLimiter(requests_per_minute, burst=max_workers) if requests_per_minute else None
+    
+    # Các batch độc lập nhau (mỗi batch sửa segments của riêng nó) nên gửi song song được
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        list(executor.map(
+            lambda batch: _translate_batch(batch, api_key, model, session, limiter),
+            batches
+        ))
+    
+    return segments
+
+
+def _translate_batch(
+    batch: List[Dict],
+    api_key: str,
+    model: str,
+    session: Optional[requests.Session] = None,
+    limiter: Optional[RateLimiter] = None
+) -> None:
+    """Dịch một batch segments (in-place), fallback về text gốc nếu lỗi"""
+    try:
+        # Chuẩn bị text để dịch
+        text_to_translate = _json_dumps([
+            {"id": seg["id"], "english": seg["text"]}
+            for seg in batch
+        ])
+        
+        prompt = _PROMPT_PREFIX + text_to_translate + _PROMPT_SUFFIX
+        
+        # Cùng prompt (batch + template) đã dịch trước đó với cùng model -> không gọi API
+        cached = get_cached_translation(model, prompt)
+        if cached:
+            _apply_translations(batch, cached)
+            return
+        
+        # Gọi API (chờ token nếu đang bị giới hạn rate)
+        if limiter is not None:
+            limiter.acquire()
+        response = call_openrouter(api_key, model, prompt, session=session)
+        
+        if response:
+            # Parse response và cập nhật segments
+            try:
+                translations = parse_translation_response(response)
+                
+                if not translations:
+                    # Nếu parse không được gì, fallback
+                    raise ValueError("Không thể parse response từ AI")
+                
+                _apply_translations(batch, translations)
+                # Chỉ cache khi đủ bản dịch cho cả batch: batch thiếu id mà được cache
+                # thì các đoạn thiếu sẽ giữ tiếng Anh mãi, dịch lại cũng chỉ trúng cache
+                if all(_has_translation(translations, seg["id"]) for seg in batch):
+                    set_cached_translation(model, prompt, translations)
+                            
+            except Exception as parse_error:
+                print(f"Error parsing translation: {parse_error}")
+                print(f"Raw response: {response[:500] if response else 'None'}")
+                # Fallback: giữ nguyên text gốc
                 for seg in batch:
                     if not seg.get("vietnamese"):
                         seg["vietnamese"] = seg["text"]
-                        
-        except Exception as batch_error:
-            print(f"Error processing batch: {batch_error}")
-            # Fallback cho cả batch
+        else:
+            # Nếu API không trả về gì, fallback
             for seg in batch:
                 if not seg.get("vietnamese"):
                     seg["vietnamese"] = seg["text"]
-    
-    return segments
+                    
+    except Exception as batch_error:
+        print(f"Error processing batch: {batch_error}")
+        # Fallback cho cả batch
+        for seg in batch:
+            if not seg.get("vietnamese"):
+                seg["vietnamese"] = seg["text"]
+
+
+def _has_translation(translations: Dict, seg_id) -> bool:
+    """Có bản dịch cho id không (id trong cache dạng string)"""
+    return bool(translations.get(seg_id) or translations.get(str(seg_id)))
+
+
+def _apply_translations(batch: List[Dict], translations: Dict) -> None:
+    """Điền bản dịch vào batch (in-place), giữ text gốc cho đoạn không có bản dịch"""
+    for seg in batch:
+        seg_id = seg["id"]
+        # Thử nhiều cách match id (id trong cache dạng string)
+        if seg_id in translations:
+            seg["vietnamese"] = translations[seg_id]
+        elif str(seg_id) in translations:
+            seg["vietnamese"] = translations[str(seg_id)]
+        else:
+            # Fallback nếu không tìm thấy
+            if not seg.get("vietnamese"):
+                seg["vietnamese"] = seg["text"]
 
 
 def call_openrouter(
     api_key: str,
     model: str,
     prompt: str,
-    max_tokens: int = 4096
+    max_tokens: int = 4096,
+    session: Optional[requests.Session] = None
 ) -> Optional[str]:
     """
     Gọi OpenRouter API
@@ -107,6 +195,7 @@ def call_openrouter(
         model: Model ID
         prompt: Prompt text
         max_tokens: Max tokens trong response
+        session: requests.Session riêng (mặc định dùng session chung của module)
     
     Returns:
         Response text hoặc None nếu lỗi
@@ -135,7 +224,8 @@ def call_openrouter(
     }
     
     try:
-        response = requests.post(
+        http = session if session is not None else _SESSION
+        response = http.post(
             OPENROUTER_API_URL,
             headers=headers,
             json=payload,
@@ -155,46 +245,49 @@ def parse_translation_response(response: str) -> Dict[int, str]:
     """
     Parse JSON response từ LLM
     
+    LLM có thể bọc JSON trong code block hoặc thêm text trước/sau, nên quét từ
+    dấu '[' đầu tiên bằng JSONDecoder.raw_decode (dừng ngay khi hết array,
+    bỏ qua phần thừa phía sau) thay vì cắt chuỗi bằng regex.
+    
     Args:
         response: Raw response string
     
     Returns:
         Dict mapping id -> vietnamese text
     """
-    import re
-    
-    # Tìm JSON trong response
-    # LLM có thể trả về với text bổ sung
+    translations = None
+    start = response.find('[')
+    first = start
+    object_start = -1
     
-    # Thử tìm trong code block trước
-    if '```json' in response:
-        match = re.search(r'```json\s*([\s\S]*?)\s*```', response)
-        if match:
-            response = match.group(1)
-    elif '```' in response:
-        match = re.search(r'```\s*([\s\S]*?)\s*```', response)
-        if match:
-            response = match.group(1)
-    else:
-        # Tìm JSON array
-        start = response.find('[')
-        end = response.rfind(']') + 1
-        if start != -1 and end > 0:
-            response = response[start:end]
+    # Thử từng '[' cho đến khi decode được một array chứa object. Text phía trước
+    # có thể chứa '[' decode được thành list khác, ví dụ "[1] Here: [{...}]"
+    while start != -1:
+        # Nhớ '[' đầu tiên mở một array object để dùng khi phải sửa JSON bên dưới
+        if response[start + 1:].lstrip().startswith('{') and object_start == -1:
+            object_start = start
+        try:
+            obj, _ = _DECODER.raw_decode(response, start)
+            if isinstance(obj, list) and any(isinstance(item, dict) for item in obj):
+                translations = obj
+                break
+        except json.JSONDecodeError:
+            pass
+        start = response.find('[', start + 1)
     
-    try:
-        translations = json.loads(response.strip())
-    except json.JSONDecodeError:
-        # Thử sửa JSON bị lỗi
-        response = response.strip()
-        if not response.startswith('['):
-            response = '[' + response
-        if not response.endswith(']'):
-            response = response + ']'
-        translations = json.loads(response)
+    if translations is None:
+        # Thử sửa JSON bị lỗi: thiếu '[' hoặc bị cắt (hết max_tokens) nên thiếu ']'
+        fixed = response[max(object_start if object_start != -1 else first, 0):].strip().rstrip('`').rstrip()
+        if not fixed.startswith('['):
+            fixed = '[' + fixed
+        if not fixed.endswith(']'):
+            fixed = fixed + ']'
+        translations = _json_loads(fixed)
     
     result = {}
     for item in translations:
+        if not isinstance(item, dict):
+            continue
         # Hỗ trợ nhiều format: id có thể là int hoặc string
         item_id = item.get("id") or item.get("ID") or item.get("Id")
         vietnamese = item.get("vietnamese") or item.get("Vietnamese") or item.get("vi") or item.get("translation")
@@ -233,26 +326,39 @@ def translate_single(
     return response.strip() if response else text
 
 
-def estimate_cost(segments: List[Dict], model: str) -> float:
+def estimate_cost(
+    segments: List[Dict],
+    model: str,
+    fast_estimate: bool = False,
+    batch_size: int = 20
+) -> float:
     """
     Ước tính chi phí dịch thuật (Display Cost = Real Cost x 2)
     
     Args:
         segments: List segments
         model: Model ID
+        fast_estimate: Ước tính theo số ký tự (~4 ký tự/token) thay vì tách từ
+        batch_size: Số câu mỗi request (prompt overhead tính một lần mỗi batch)
     
     Returns:
         Chi phí hiển thị (USD)
     """
     # 1. Estimate Tokens
-    # 1 word ~ 1.3 tokens
-    total_words = sum(len(seg["text"].split()) for seg in segments)
-    input_tokens = int(total_words * 1.3)
+    if fast_estimate:
+        # ~4 ký tự tiếng Anh ~ 1 token, không cần split() tạo list từ cho mỗi câu
+        total_chars = sum(len(seg["text"]) for seg in segments)
+        input_tokens = total_chars // 4
+    else:
+        # 1 word ~ 1.3 tokens
+        total_words = sum(len(seg["text"].split()) for seg in segments)
+        input_tokens = int(total_words * 1.3)
     
     # Giả định output (tiếng Việt) dài hơn input chút xíu hoặc tương đương
     # Với prompt template, input thực tế sẽ nhiều hơn do context prompt
     # Prompt overhead ~ 200 tokens
-    input_tokens_with_prompt = input_tokens + (200 * len(segments) / 20) # Batch size 20 avg
+    num_batches = -(-len(segments) // batch_size)  # ceil
+    input_tokens_with_prompt = input_tokens + 200 * num_batches
     output_tokens = int(input_tokens * 1.5) # Tiếng Việt thường tốn nhiều token hơn
     
     # 2. Pricing Configuration (per 1M tokens)
@@ -3,17 +3,27 @@ VietDub Solo - Text-to-Speech Module
 Hỗ trợ nhiều TTS providers: FPT.AI, ElevenLabs, OpenAI
 """
 
-import requests
 import os
 import tempfile
-from typing import Optional, List, Dict
-from pydub import AudioSegment
+import subprocess
+from typing import Callable, Optional, List, Dict
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from utils.http_utils import create_session
+from utils.tts_cache import cached_synthesize
 
 
 class TTSProvider:
     """Base class for TTS providers"""
     
+    # Số request song song tối đa provider chấp nhận (tránh bị rate limit)
+    MAX_CONCURRENCY = 8
+    
+    def __init__(self, api_key: str):
+        self.api_key = api_key
+        # Session dùng chung để tái sử dụng kết nối; an toàn khi gọi từ nhiều thread
+        self.session = create_session()
+    
     def synthesize(self, text: str, voice: str, speed: float = 1.0) -> Optional[str]:
         """
         Synthesize text to speech
@@ -27,15 +37,29 @@ class TTSProvider:
             Path to audio file or None if failed
         """
         raise NotImplementedError
+    
+    @staticmethod
+    def _save_response(response, suffix: str = ".mp3") -> str:
+        """
+        Ghi body của response (request với stream=True) ra file tạm theo từng chunk 64KB
+        
+        Không giữ toàn bộ file audio trong RAM như response.content.
+        
+        Returns:
+            Đường dẫn file đã lưu
+        """
+        with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as f:
+            for chunk in response.iter_content(chunk_size=64 * 1024):
+                f.write(chunk)
+            return f.name
 
 
 class FPTProvider(TTSProvider):
     """FPT.AI TTS Provider - Best for Vietnamese"""
     
     API_URL = "https://api.fpt.ai/hmi/tts/v5"
-    
-    def __init__(self, api_key: str):
-        self.api_key = api_key
+    # Thời gian tối đa chờ file audio async sẵn sàng (seconds)
+    MAX_WAIT = 10
     
     def synthesize(self, text: str, voice: str = "banmai", speed: float = 1.0) -> Optional[str]:
         if not self.api_key:
@@ -48,7 +72,7 @@ class FPTProvider(TTSProvider):
         }
         
         try:
-            response = requests.post(
+            response = self.session.post(
                 self.API_URL,
                 headers=headers,
                 data=text.encode('utf-8'),
@@ -65,31 +89,40 @@ class FPTProvider(TTSProvider):
             audio_url = data["async"]
             
             # Đợi file sẵn sàng
-            time.sleep(1)
-            
-            # Download audio
-            audio_response = requests.get(audio_url, timeout=30)
-            audio_response.raise_for_status()
-            
-            # Lưu file
-            output_path = tempfile.mktemp(suffix=".mp3")
-            with open(output_path, 'wb') as f:
-                f.write(audio_response.content)
+            self._wait_until_ready(audio_url)
             
-            return output_path
+            # Download audio và lưu file
+            with self.session.get(audio_url, timeout=30, stream=True) as audio_response:
+                audio_response.raise_for_status()
+                return self._save_response(audio_response)
             
         except Exception as e:
             print(f"FPT.AI TTS error: {e}")
             return None
+    
+    def _wait_until_ready(self, audio_url: str):
+        """
+        Poll URL bằng HEAD với backoff (0.2s, 0.4s, ... tối đa 2s) đến khi hết 404
+        
+        File thường sẵn sàng sau vài trăm ms nên không phải ngủ cố định 1s,
+        và file lâu hơn 1s cũng không bị GET 404.
+        """
+        deadline = time.monotonic() + self.MAX_WAIT
+        delay = 0.2
+        
+        while time.monotonic() < deadline:
+            response = self.session.head(audio_url, timeout=5, allow_redirects=True)
+            if response.status_code != 404:
+                return
+            time.sleep(delay)
+            delay = min(delay * 2, 2.0)
 
 
 class ElevenLabsProvider(TTSProvider):
     """ElevenLabs TTS Provider - Good for multilingual"""
     
     API_URL = "https://api.elevenlabs.io/v1/text-to-speech"
-    
-    def __init__(self, api_key: str):
-        self.api_key = api_key
+    MAX_CONCURRENCY = 4
     
     def synthesize(self, text: str, voice: str = "21m00Tcm4TlvDq8ikWAM", speed: float = 1.0) -> Optional[str]:
         if not self.api_key:
@@ -113,17 +146,15 @@ class ElevenLabsProvider(TTSProvider):
         }
         
         try:
-            response = requests.post(
+            with self.session.post(
                 f"{self.API_URL}/{voice}",
                 headers=headers,
                 json=payload,
-                timeout=60
-            )
-            response.raise_for_status()
-            
-            output_path = tempfile.mktemp(suffix=".mp3")
-            with open(output_path, 'wb') as f:
-                f.write(response.content)
+                timeout=60,
+                stream=True
+            ) as response:
+                response.raise_for_status()
+                output_path = self._save_response(response)
             
             # Adjust speed if needed
             if speed != 1.0:
@@ -140,9 +171,7 @@ class OpenAIProvider(TTSProvider):
     """OpenAI TTS Provider - Easy to use"""
     
     API_URL = "https://api.openai.com/v1/audio/speech"
-    
-    def __init__(self, api_key: str):
-        self.api_key = api_key
+    MAX_CONCURRENCY = 10
     
     def synthesize(self, text: str, voice: str = "nova", speed: float = 1.0) -> Optional[str]:
         if not self.api_key:
@@ -161,19 +190,15 @@ class OpenAIProvider(TTSProvider):
         }
         
         try:
-            response = requests.post(
+            with self.session.post(
                 self.API_URL,
                 headers=headers,
                 json=payload,
-                timeout=60
-            )
-            response.raise_for_status()
-            
-            output_path = tempfile.mktemp(suffix=".mp3")
-            with open(output_path, 'wb') as f:
-                f.write(response.content)
-            
-            return output_path
+                timeout=60,
+                stream=True
+            ) as response:
+                response.raise_for_status()
+                return self._save_response(response)
             
         except Exception as e:
             print(f"OpenAI TTS error: {e}")
@@ -203,18 +228,27 @@ def get_tts_provider(provider_name: str, api_key: str) -> TTSProvider:
     return providers[provider_name](api_key)
 
 
-def adjust_audio_speed(audio_path: str, speed: float) -> str:
+def adjust_audio_speed(
+    audio_path: str,
+    speed: float,
+    keep_input: bool = False,
+    output_dir: Optional[str] = None
+) -> str:
     """
     Điều chỉnh tốc độ audio bằng thuật toán chất lượng cao (giữ pitch)
     
     Args:
         audio_path: Đường dẫn file audio
         speed: Tốc độ mới (1.0 = không đổi, >1.0 = nhanh hơn)
+        keep_input: Giữ file input (ví dụ file trong TTS cache), mặc định xóa
+        output_dir: Thư mục ghi file mới (mặc định thư mục temp của hệ thống)
     
     Returns:
-        Đường dẫn file audio mới
+        Đường dẫn file audio mới (WAV)
     """
-    output_path = tempfile.mktemp(suffix=".mp3")
+    # Ghi PCM (WAV) thay vì mp3: audio chỉ bị encode lossy một lần duy nhất
+    # khi export, không phải decode/encode mp3 thêm một lượt ở bước đổi tốc độ
+    output_path = tempfile.mktemp(suffix=".wav", dir=output_dir)
     
     # Sử dụng FFmpeg atempo filter để giữ pitch khi thay đổi tốc độ
     # atempo chỉ hỗ trợ từ 0.5 đến 2.0. Nếu speed > 2.0, cần chain filter
@@ -227,13 +261,14 @@ def adjust_audio_speed(audio_path: str, speed: float) -> str:
         "-i", audio_path,
         "-filter:a", atempo_filter,
         "-vn",
+        "-c:a", "pcm_s16le",
         output_path
     ]
     
     try:
         subprocess.run(cmd, capture_output=True, check=True)
         # Cleanup old file
-        if os.path.exists(audio_path):
+        if not keep_input and os.path.exists(audio_path):
             os.remove(audio_path)
         return output_path
     except Exception as e:
@@ -242,10 +277,20 @@ def adjust_audio_speed(audio_path: str, speed: float) -> str:
 
 
 def get_audio_duration(audio_path: str) -> float:
-    """Lấy duration của audio file (seconds)"""
+    """Lấy duration của audio file (seconds) bằng ffprobe, chỉ đọc header không decode"""
     try:
-        audio = AudioSegment.from_file(audio_path)
-        return len(audio) / 1000.0
+        result = subprocess.run(
+            [
+                "ffprobe", "-v", "error",
+                "-show_entries", "format=duration",
+                "-of", "csv=p=0",
+                audio_path
+            ],
+            capture_output=True,
+            text=True,
+            timeout=10
+        )
+        return float(result.stdout.strip())
     except:
         return 0.0
 
@@ -253,10 +298,15 @@ def get_audio_duration(audio_path: str) -> float:
 def fit_audio_to_duration(
     audio_path: str,
     target_duration: float,
-    max_speed: float = 1.5  # Tăng max speed lên 1.5
+    max_speed: float = 1.5,  # Tăng max speed lên 1.5
+    keep_input: bool = False,
+    output_dir: Optional[str] = None
 ) -> str:
     """
     Điều chỉnh audio để fit vào duration mục tiêu
+    
+    Trả về chính audio_path nếu đã vừa, ngược lại là file mới đã tăng tốc
+    (file input bị xóa trừ khi keep_input=True), ghi vào output_dir nếu có.
     """
     current_duration = get_audio_duration(audio_path)
     
@@ -269,10 +319,8 @@ def fit_audio_to_duration(
     # Giới hạn speed
     actual_speed = min(required_speed, max_speed)
     
-    return adjust_audio_speed(audio_path, actual_speed)
-
+    return adjust_audio_speed(audio_path, actual_speed, keep_input=keep_input, output_dir=output_dir)
 
-import subprocess
 
 def generate_all_audio(
     segments: List[Dict],
@@ -281,45 +329,110 @@ def generate_all_audio(
     voice: str,
     speed: float = 1.0,
     fit_duration: bool = True,
-    progress_callback=None
+    progress_callback: Optional[Callable[[str, float], None]] = None,
+    max_workers: int = 8,
+    provider: Optional[TTSProvider] = None,
+    skip_segment: Optional[Callable[[Dict], bool]] = None,
+    output_dir: Optional[str] = None
 ) -> List[Dict]:
     """
     Generate audio cho tất cả segments
+    
+    Các segment được synthesize song song (I/O-bound), số thread bị giới hạn
+    bởi MAX_CONCURRENCY của provider. Các segment trùng text được gom lại để
+    chỉ gọi API một lần. Kết quả ghi theo index nên giữ đúng thứ tự.
+    
+    Args:
+        segments: List segments (được cập nhật audio_path tại chỗ)
+        provider_name: Tên TTS provider
+        api_key: API key của provider
+        voice: Giọng đọc
+        speed: Tốc độ đọc
+        fit_duration: Tăng tốc audio cho vừa khoảng trống trước segment kế tiếp
+        progress_callback: Callback(message, tỉ lệ hoàn thành 0..1)
+        max_workers: Số request song song tối đa
+        provider: Provider đã tạo sẵn (giữ HTTP session qua nhiều lần gọi)
+        skip_segment: Trả về True nếu segment đã có audio dùng được, không cần generate lại
+        output_dir: Thư mục ghi audio đã fit (ví dụ thư mục session, để được dọn cùng session)
+    
+    Returns:
+        List segments đã có audio_path
     """
-    provider = get_tts_provider(provider_name, api_key)
+    if provider is None:
+        provider = get_tts_provider(provider_name, api_key)
+    workers = max(1, min(max_workers, provider.MAX_CONCURRENCY))
     
+    # Gom index theo text: mỗi text chỉ một task
+    pending: Dict[str, List[int]] = {}
     for i, seg in enumerate(segments):
-        if progress_callback:
-            progress_callback(f"Generating audio {i+1}/{len(segments)}...")
-        
         text = seg.get("vietnamese") or seg.get("text", "")
+        if text and not (skip_segment and skip_segment(seg)):
+            pending.setdefault(text, []).append(i)
+    
+    total = sum(len(indices) for indices in pending.values())
+    done = 0
+    
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        tasks = {
+            executor.submit(_generate_text_audio, provider, segments, indices, text, voice, speed, fit_duration, output_dir): indices
+            for text, indices in pending.items()
+        }
         
-        if not text:
-            continue
-        
-        try:
-            # Generate audio
-            audio_path = provider.synthesize(text, voice, speed)
+        for future in as_completed(tasks):
+            indices = tasks[future]
+            try:
+                audio_paths = future.result()
+            except Exception as e:
+                print(f"Error generating audio for segment {segments[indices[0]]['id']}: {e}")
+                audio_paths = {}
             
-            if audio_path and fit_duration:
-                # Tính khoảng trống cho phép
-                # Nếu có segment tiếp theo, duration = start_next - start_current
-                # Nếu là segment cuối, duration = end_current - start_current
-                
-                start_time = seg["start"]
-                if i < len(segments) - 1:
-                    next_start = segments[i+1]["start"]
-                    # Trừ đi 0.1s làm buffer an toàn để tránh dính nhau
-                    available_duration = max(0.5, next_start - start_time - 0.1) 
-                else:
-                    available_duration = seg["end"] - start_time
-                
-                audio_path = fit_audio_to_duration(audio_path, available_duration)
+            for i in indices:
+                segments[i]["audio_path"] = audio_paths.get(i) or ""
             
-            seg["audio_path"] = audio_path or ""
-            
-        except Exception as e:
-            print(f"Error generating audio for segment {seg['id']}: {e}")
-            seg["audio_path"] = ""
+            done += len(indices)
+            if progress_callback:
+                progress_callback(f"Generating audio {done}/{total}...", done / total)
     
     return segments
+
+
+def _generate_text_audio(
+    provider: TTSProvider,
+    segments: List[Dict],
+    indices: List[int],
+    text: str,
+    voice: str,
+    speed: float,
+    fit_duration: bool,
+    output_dir: Optional[str] = None
+) -> Dict[int, Optional[str]]:
+    """Synthesize một text (một request) rồi fit cho từng segment dùng text đó"""
+    # Generate audio (lấy từ cache nếu cùng provider/voice/speed/text đã tạo trước đó)
+    audio_path = cached_synthesize(provider, text, voice, speed)
+    if not audio_path:
+        return {}
+    
+    return {
+        i: _fit_segment_audio(segments, i, audio_path, output_dir) if fit_duration else audio_path
+        for i in indices
+    }
+
+
+def _fit_segment_audio(segments: List[Dict], i: int, audio_path: str, output_dir: Optional[str] = None) -> str:
+    """Fit audio của segment i vào khoảng trống trước segment kế tiếp"""
+    seg = segments[i]
+    
+    # Tính khoảng trống cho phép
+    # Nếu có segment tiếp theo, duration = start_next - start_current
+    # Nếu là segment cuối, duration = end_current - start_current
+    start_time = seg["start"]
+    if i < len(segments) - 1:
+        next_start = segments[i+1]["start"]
+        # Trừ đi 0.1s làm buffer an toàn để tránh dính nhau
+        available_duration = max(0.5, next_start - start_time - 0.1) 
+    else:
+        available_duration = seg["end"] - start_time
+    
+    # Giữ nguyên file trong cache: đoạn vừa thì dùng thẳng file cache (không copy),
+    # đoạn phải tăng tốc thì ffmpeg ghi ra file mới
+    return fit_audio_to_duration(audio_path, available_duration, keep_input=True, output_dir=output_dir)
@@ -0,0 +1,56 @@
+"""
+VietDub Solo - Background Jobs
+Chạy các tác vụ dài (transcribe, export) trong thread riêng để UI không bị block
+"""
+
+import uuid
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Dict, Optional
+
+
+# Executor dùng chung cho cả process (các session cùng chia sẻ)
+_EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix="vietdub-job")
+
+
+def submit(jobs: Dict[str, Future], fn, *args, **kwargs) -> str:
+    """
+    Chạy fn(*args, **kwargs) trong background
+
+    Args:
+        jobs: Dict lưu các job của session (ví dụ st.session_state.jobs)
+        fn: Hàm cần chạy
+
+    Returns:
+        Job ID
+    """
+    job_id = uuid.uuid4().hex
+    jobs[job_id] = _EXECUTOR.submit(fn, *args, **kwargs)
+    return job_id
+
+
+def get_job(jobs: Dict[str, Future], job_id: Optional[str]) -> Optional[Future]:
+    """Lấy Future của job (None nếu không tồn tại)"""
+    if not job_id:
+        return None
+    return jobs.get(job_id)
+
+
+def pop_job(jobs: Dict[str, Future], job_id: Optional[str]) -> Optional[Future]:
+    """Xóa job khỏi danh sách và trả về Future của nó"""
+    if not job_id:
+        return None
+    return jobs.pop(job_id, None)
+
+
+def cancel_job(jobs: Dict[str, Future], job_id: Optional[str]) -> bool:
+    """
+    Hủy job
+
+    Job chưa chạy sẽ bị hủy hẳn. Job đang chạy không thể dừng giữa chừng,
+    chỉ bị bỏ khỏi danh sách và kết quả sẽ bị bỏ qua.
+
+    Returns:
+        True nếu job được hủy trước khi chạy
+    """
+    future = pop_job(jobs, job_id)
+    return future.cancel() if future else False
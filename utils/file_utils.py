@@ -3,14 +3,21 @@ VietDub Solo - File Utilities
 """
 
 import os
+import json
 import tempfile
 import shutil
+import time
+import hashlib
+import functools
+import subprocess
 from typing import Optional
-import yt_dlp
 
 
 TEMP_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "temp")
 
+# Thư mục session không được đụng tới quá số giờ này coi như bị bỏ (tab đã đóng/refresh)
+SESSION_DIR_MAX_AGE_HOURS = 24
+
 
 def ensure_temp_dir():
     """Đảm bảo thư mục temp tồn tại"""
@@ -18,17 +25,65 @@ def ensure_temp_dir():
     return TEMP_DIR
 
 
-def download_youtube(url: str, output_path: Optional[str] = None) -> Optional[str]:
+def prune_session_dirs(max_age_hours: float = SESSION_DIR_MAX_AGE_HOURS) -> int:
+    """
+    Xóa các thư mục session_* cũ hơn max_age_hours (session đã bị bỏ)
+    
+    Args:
+        max_age_hours: Tuổi tối đa tính theo lần sửa cuối của thư mục hoặc file bên trong
+    
+    Returns:
+        Số thư mục đã xóa
+    """
+    if not os.path.isdir(TEMP_DIR):
+        return 0
+    
+    cutoff = time.time() - max_age_hours * 3600
+    removed = 0
+    for entry in os.scandir(TEMP_DIR):
+        if not entry.name.startswith("session_") or not entry.is_dir(follow_symlinks=False):
+            continue
+        try:
+            last_modified = max(
+                [entry.stat().st_mtime] + [f.stat().st_mtime for f in os.scandir(entry.path)]
+            )
+        except OSError:
+            continue
+        if last_modified < cutoff:
+            shutil.rmtree(entry.path, ignore_errors=True)
+            removed += 1
+    return removed
+
+
+def create_session_dir() -> str:
+    """
+    Tạo thư mục temp riêng cho một session (nằm trong TEMP_DIR)
+    
+    Session mới cũng dọn luôn các thư mục session cũ đã bị bỏ,
+    vì mỗi lần refresh trang là một session mới.
+    
+    Returns:
+        Đường dẫn thư mục vừa tạo
+    """
+    prune_session_dirs()
+    return tempfile.mkdtemp(prefix="session_", dir=ensure_temp_dir())
+
+
+def download_youtube(url: str, output_path: Optional[str] = None, audio_only: bool = False) -> Optional[str]:
     """
     Download video từ YouTube
     
     Args:
         url: YouTube URL
         output_path: Output path (optional)
+        audio_only: Chỉ tải audio và chuyển thành WAV 16kHz mono (đủ để transcribe,
+            nhỏ hơn video nhiều lần, nhưng không export video được)
     
     Returns:
-        Đường dẫn file video hoặc None nếu lỗi
+        Đường dẫn file video (hoặc file WAV nếu audio_only) hoặc None nếu lỗi
     """
+    import yt_dlp
+    
     ensure_temp_dir()
     
     if output_path is None:
@@ -40,6 +95,9 @@ def download_youtube(url: str, output_path: Optional[str] = None) -> Optional[st
         'quiet': True,
         'no_warnings': True,
         'merge_output_format': 'mp4',
+        # Tải nhiều fragment (DASH/HLS) song song + chia nhỏ request HTTP
+        'concurrent_fragment_downloads': 8,
+        'http_chunk_size': 10 * 1024 * 1024,
         # Anti-bot options
         'nocheckcertificate': True,
         'ignoreerrors': False,
@@ -54,6 +112,20 @@ def download_youtube(url: str, output_path: Optional[str] = None) -> Optional[st
         }
     }
     
+    if audio_only:
+        ydl_opts['format'] = 'bestaudio[ext=m4a]/bestaudio'
+        del ydl_opts['merge_output_format']
+        ydl_opts['postprocessors'] = [{
+            'key': 'FFmpegExtractAudio',
+            'preferredcodec': 'wav',
+        }]
+        ydl_opts['postprocessor_args'] = {'extractaudio': ['-ar', '16000', '-ac', '1']}
+    
+    # Dùng aria2c (nhiều connection mỗi file) nếu có cài
+    if shutil.which('aria2c'):
+        ydl_opts['external_downloader'] = 'aria2c'
+        ydl_opts['external_downloader_args'] = ['-x', '16', '-s', '16', '-k', '1M']
+    
     try:
         with yt_dlp.YoutubeDL(ydl_opts) as ydl:
             info = ydl.extract_info(url, download=True)
@@ -75,30 +147,64 @@ def get_video_info(video_path: str) -> dict:
     """
     Lấy thông tin video
     
+    Chỉ đọc metadata bằng ffprobe, không mở decoder như VideoFileClip. Kết quả
+    được cache theo (path, size, mtime) nên gọi lại cho cùng file không chạy ffprobe.
+    
     Args:
         video_path: Đường dẫn video
     
     Returns:
         Dict với thông tin video
     """
-    from moviepy.editor import VideoFileClip
-    
     try:
-        video = VideoFileClip(video_path)
-        info = {
-            "duration": video.duration,
-            "fps": video.fps,
-            "size": video.size,
-            "width": video.size[0],
-            "height": video.size[1]
-        }
-        video.close()
-        return info
+        stat = os.stat(video_path)
+        # Copy để caller sửa dict không làm hỏng cache
+        return dict(_probe(video_path, stat.st_size, stat.st_mtime))
     except Exception as e:
         print(f"Error getting video info: {e}")
         return {}
 
 
+@functools.lru_cache(maxsize=32)
+def _probe(video_path: str, size: int, mtime: float) -> dict:
+    """Chạy ffprobe một lần cho mỗi phiên bản file (size/mtime để invalidate)"""
+    result = subprocess.run(
+        [
+            "ffprobe", "-v", "quiet",
+            "-print_format", "json",
+            "-show_format", "-show_streams",
+            video_path
+        ],
+        capture_output=True,
+        text=True,
+        timeout=30
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr or "ffprobe failed")
+    
+    probe = json.loads(result.stdout)
+    streams = probe.get("streams", [])
+    video = next((s for s in streams if s.get("codec_type") == "video"), {})
+    audio = next((s for s in streams if s.get("codec_type") == "audio"), None)
+    
+    # Frame rate dạng phân số, ví dụ "30000/1001"
+    num, _, den = video.get("avg_frame_rate", "0/1").partition("/")
+    fps = float(num) / float(den) if den and float(den) else 0.0
+    
+    width = int(video.get("width", 0))
+    height = int(video.get("height", 0))
+    return {
+        "duration": float(probe.get("format", {}).get("duration", 0)),
+        "fps": fps,
+        "size": [width, height],
+        "width": width,
+        "height": height,
+        "has_audio": audio is not None,
+        "audio_codec": audio.get("codec_name") if audio else None,
+        "sample_rate": int(audio.get("sample_rate", 0)) if audio else 0
+    }
+
+
 def cleanup_temp_files():
     """Dọn dẹp thư mục temp"""
     if os.path.exists(TEMP_DIR):
@@ -106,26 +212,53 @@ def cleanup_temp_files():
         os.makedirs(TEMP_DIR)
 
 
-def save_uploaded_file(uploaded_file) -> Optional[str]:
+def save_uploaded_file(uploaded_file, output_dir: Optional[str] = None) -> Optional[str]:
     """
     Lưu file được upload từ Streamlit
     
     Args:
         uploaded_file: Streamlit UploadedFile object
+        output_dir: Thư mục lưu (mặc định TEMP_DIR)
     
     Returns:
         Đường dẫn file đã lưu
     """
-    ensure_temp_dir()
+    if output_dir is None:
+        output_dir = ensure_temp_dir()
     
-    file_path = os.path.join(TEMP_DIR, uploaded_file.name)
+    file_path = os.path.join(output_dir, uploaded_file.name)
     
+    # Copy theo chunk 4MB, không tạo thêm một bản copy toàn bộ video trong RAM
+    uploaded_file.seek(0)
     with open(file_path, 'wb') as f:
-        f.write(uploaded_file.getbuffer())
+        shutil.copyfileobj(uploaded_file, f, length=4 * 1024 * 1024)
     
     return file_path
 
 
+def file_fingerprint(file_path: str, sample_size: int = 1024 * 1024) -> str:
+    """
+    Fingerprint nhanh của file: SHA-1 của (kích thước + 1MB đầu + 1MB cuối)
+    
+    Không phải đọc cả file như hash toàn bộ nội dung, đủ để nhận ra cùng một video.
+    
+    Args:
+        file_path: Đường dẫn file
+        sample_size: Số bytes đọc ở đầu và cuối file
+    
+    Returns:
+        Hex digest
+    """
+    size = os.path.getsize(file_path)
+    sha = hashlib.sha1(str(size).encode())
+    with open(file_path, 'rb') as f:
+        sha.update(f.read(sample_size))
+        if size > sample_size:
+            f.seek(max(size - sample_size, sample_size))
+            sha.update(f.read(sample_size))
+    return sha.hexdigest()
+
+
 def is_youtube_url(url: str) -> bool:
     """Kiểm tra có phải YouTube URL không"""
     youtube_patterns = [
@@ -0,0 +1,85 @@
+"""
+VietDub Solo - HTTP Utilities
+"""
+
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+# Status được retry cho POST: server báo chưa xử lý request (rate limit / quá tải).
+# 500/502/504 có thể xảy ra sau khi request đã được xử lý và tính phí
+POST_RETRY_STATUSES = frozenset([429, 503])
+
+
+class _PaidRequestRetry(Retry):
+    """Retry như urllib3, nhưng POST chỉ retry với POST_RETRY_STATUSES"""
+    
+    def is_retry(self, method: str, status_code: int, has_retry_after: bool = False) -> bool:
+        if method and method.upper() == "POST" and status_code not in POST_RETRY_STATUSES:
+            return False
+        return super().is_retry(method, status_code, has_retry_after)
+
+
+def create_session(pool_size: int = 16, retries: int = 3) -> requests.Session:
+    """
+    Tạo requests.Session với connection pool để tái sử dụng kết nối (keep-alive)
+    
+    Lỗi kết nối, 429 và 5xx được tự động retry với backoff (tôn trọng header
+    Retry-After). Request đã tới server có thể đã được xử lý và tính phí, nên
+    không retry lỗi đọc (read=0) và POST chỉ retry với 429/503.
+    
+    Args:
+        pool_size: Số connection tối đa giữ trong pool (nên >= số thread gọi song song)
+        retries: Số lần retry tối đa
+    
+    Returns:
+        requests.Session instance
+    """
+    retry = _PaidRequestRetry(
+        total=retries,
+        read=0,
+        backoff_factor=0.5,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=frozenset(["HEAD", "GET", "POST"]),
+        raise_on_status=False
+    )
+    
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+class RateLimiter:
+    """
+    Token bucket giới hạn số request mỗi phút, dùng chung giữa các thread
+    
+    Bucket đầy cho phép gửi ngay một loạt `burst` request, sau đó mỗi request
+    phải chờ token được nạp lại với tốc độ requests_per_minute / 60 mỗi giây.
+    """
+    
+    def __init__(self, requests_per_minute: float, burst: int = 1):
+        self.rate = requests_per_minute / 60.0
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+    
+    def acquire(self):
+        """Chờ đến khi có token rồi lấy một token"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            
+            time.sleep(wait)
@@ -0,0 +1,78 @@
+"""
+VietDub Solo - Translation Cache
+Cache kết quả dịch trên đĩa (SQLite) theo prompt và model
+"""
+
+import os
+import json
+import sqlite3
+import hashlib
+from typing import Dict, Optional
+from utils.file_utils import TEMP_DIR
+
+
+CACHE_PATH = os.path.join(TEMP_DIR, "translation_cache.sqlite3")
+
+
+def _connect() -> sqlite3.Connection:
+    """Mở connection mới (mỗi thread dịch dùng connection riêng)"""
+    os.makedirs(TEMP_DIR, exist_ok=True)
+    conn = sqlite3.connect(CACHE_PATH, timeout=30)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS translations (key TEXT PRIMARY KEY, value TEXT NOT NULL)"
+    )
+    return conn
+
+
+def get_cache_key(model: str, text: str) -> str:
+    """Key cache (SHA-256 của model|text)"""
+    return hashlib.sha256(f"{model}|{text}".encode('utf-8')).hexdigest()
+
+
+def get_cached_translation(model: str, text: str) -> Optional[Dict[str, str]]:
+    """
+    Lấy bản dịch đã cache của một batch
+    
+    Args:
+        model: Model ID
+        text: Prompt đã gửi cho model (chứa JSON batch tiếng Anh)
+    
+    Returns:
+        Dict id -> vietnamese (id dạng string) hoặc None nếu chưa có
+    """
+    try:
+        conn = _connect()
+        try:
+            row = conn.execute(
+                "SELECT value FROM translations WHERE key = ?",
+                (get_cache_key(model, text),)
+            ).fetchone()
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        print(f"Translation cache error: {e}")
+        return None
+    
+    return json.loads(row[0]) if row else None
+
+
+def set_cached_translation(model: str, text: str, translations: Dict) -> None:
+    """Lưu bản dịch của một batch vào cache"""
+    try:
+        conn = _connect()
+        try:
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO translations (key, value) VALUES (?, ?)",
+                    (get_cache_key(model, text), json.dumps(translations, ensure_ascii=False))
+                )
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        print(f"Translation cache error: {e}")
+
+
+def clear_translation_cache() -> None:
+    """Xóa toàn bộ cache dịch"""
+    if os.path.exists(CACHE_PATH):
+        os.remove(CACHE_PATH)
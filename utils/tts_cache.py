@@ -0,0 +1,99 @@
+"""
+VietDub Solo - TTS Cache
+Cache audio TTS trên đĩa theo nội dung (provider, voice, speed, text)
+"""
+
+import os
+import hashlib
+import shutil
+import tempfile
+import threading
+from typing import List, Optional
+from utils.file_utils import TEMP_DIR
+
+
+CACHE_DIR = os.path.join(TEMP_DIR, "tts_cache")
+
+# Provider trả về mp3, riêng audio đã chỉnh tốc độ (adjust_audio_speed) là wav
+AUDIO_EXTENSIONS = (".mp3", ".wav")
+
+# Các thread cùng miss một key chờ nhau, chỉ một thread gọi API. Dùng một số lock
+# cố định (chia theo hash của key) thay vì một lock cho mỗi text để không phình bộ nhớ
+_LOCK_STRIPES = 64
+_KEY_LOCKS: List[threading.Lock] = [threading.Lock() for _ in range(_LOCK_STRIPES)]
+
+
+def _get_key_lock(cache_path: str) -> threading.Lock:
+    """Lock của key cache (tên file là SHA-256 nên chia đều giữa các lock)"""
+    return _KEY_LOCKS[int(os.path.basename(cache_path)[:8], 16) % _LOCK_STRIPES]
+
+
+def get_cache_path(provider_name: str, voice: str, speed: float, text: str) -> str:
+    """
+    Đường dẫn file cache chưa có đuôi (SHA-256 của provider|voice|speed|text)
+    
+    Đuôi file lấy theo định dạng thực của audio provider trả về (xem AUDIO_EXTENSIONS).
+    """
+    key = hashlib.sha256(f"{provider_name}|{voice}|{speed}|{text}".encode('utf-8')).hexdigest()
+    return os.path.join(CACHE_DIR, key)
+
+
+def _find_cached(cache_path: str) -> Optional[str]:
+    """File cache đã có của key (với bất kỳ đuôi nào), None nếu chưa có"""
+    for ext in AUDIO_EXTENSIONS:
+        if os.path.exists(cache_path + ext):
+            return cache_path + ext
+    return None
+
+
+def cached_synthesize(provider, text: str, voice: str, speed: float = 1.0) -> Optional[str]:
+    """
+    Synthesize text, dùng lại file audio nếu cùng nội dung đã được tạo trước đó
+    
+    Args:
+        provider: TTSProvider instance
+        text: Text cần đọc
+        voice: Voice ID
+        speed: Tốc độ đọc
+    
+    Returns:
+        Đường dẫn file audio trong cache hoặc None nếu lỗi
+    """
+    cache_path = get_cache_path(type(provider).__name__, voice, speed, text)
+    cached = _find_cached(cache_path)
+    if cached:
+        return cached
+    
+    with _get_key_lock(cache_path):
+        # Thread khác có thể vừa tạo xong file trong lúc chờ lock
+        cached = _find_cached(cache_path)
+        if cached:
+            return cached
+        
+        audio_path = provider.synthesize(text, voice, speed)
+        if not audio_path:
+            return None
+        
+        # Giữ đuôi của file nguồn để tên file khớp định dạng thật (mp3 hoặc wav)
+        ext = os.path.splitext(audio_path)[1].lower()
+        cache_path += ext if ext in AUDIO_EXTENSIONS else AUDIO_EXTENSIONS[0]
+        
+        # Chuyển vào file tạm trong CACHE_DIR rồi os.replace (atomic trên cùng filesystem):
+        # shutil.move sang filesystem khác là copy, thread khác có thể thấy file ghi dở
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(suffix=".part", dir=CACHE_DIR)
+        os.close(fd)
+        try:
+            shutil.move(audio_path, tmp_path)
+            os.replace(tmp_path, cache_path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+    
+    return cache_path
+
+
+def clear_tts_cache() -> None:
+    """Xóa toàn bộ audio đã cache"""
+    shutil.rmtree(CACHE_DIR, ignore_errors=True)